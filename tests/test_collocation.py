@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+pytest.importorskip('rioxarray')
+pytest.importorskip('pyproj')
+pytest.importorskip('scipy')
+
+from utils.collocation import (collocate_station_grid, collocate_stations,  # noqa: E402
+                               extract_station_series, station_overpass_series)
+
+
+def _grid():
+    # 3 days on a 0.1 degree lon/lat grid, value = 100 * day + 10 * row + column
+    days = np.arange(3)[:, None, None]
+    values = 100 * days + 10 * np.arange(4)[:, None] + np.arange(5)
+    return xr.DataArray(values.astype('float32'), dims=('time', 'y', 'x'),
+                        coords={'time': pd.date_range('2012-07-01 10:30', periods=3),
+                                'y': [41.3, 41.2, 41.1, 41.0],
+                                'x': [28.0, 28.1, 28.2, 28.3, 28.4]}).rio.write_crs(4326)
+
+
+def _metadata():
+    return pd.DataFrame({'station': ['kumkoy', 'goztepe', 'edirne'],
+                         'landuse': ['nourban', 'urban', 'nourban'],
+                         'x': [28.12, 28.38, 26.55], 'y': [41.18, 41.04, 41.67]})
+
+
+def _records():
+    dates = pd.date_range('2012-06-30', '2012-07-02 23:00', freq='h')
+    hours = dates.hour.values.astype('float64')
+    return pd.DataFrame({'Date': dates, 'kumkoy': hours, 'goztepe': hours + 1,
+                         'edirne': hours + 2})
+
+
+def test_collocate_stations():
+    collocation = collocate_stations(_grid(), _metadata(), k=2, max_distance=0.5)
+
+    assert collocation['iy'].sel(neighbour=0).values.tolist() == [1, 3, -1]
+    assert collocation['ix'].sel(neighbour=0).values.tolist() == [1, 4, -1]
+    np.testing.assert_allclose(collocation['distance'][0, 0], np.hypot(0.02, 0.02), rtol=1e-6)
+    assert np.isinf(collocation['distance'][2]).all()
+
+    # stations away from the grid get nan series
+    series = extract_station_series(_grid(), collocation.isel(neighbour=[0]))
+    assert series.isel(time=1).values.tolist()[:2] == [111, 134]
+    assert np.isnan(series.sel(station='edirne')).all()
+
+
+def test_station_overpass_series():
+    obs = station_overpass_series(_records(), ['kumkoy', 'goztepe'], overpass_hour=10.5)
+    assert obs.dims == ('time', 'station') and obs.sizes['time'] == 3
+    np.testing.assert_allclose(obs.sel(station='goztepe').values, 11.5)
+
+    # 23:30 needs 00:00 of the next day
+    late = station_overpass_series(_records(), ['kumkoy'], overpass_hour=23.5)
+    assert late.sizes['time'] == 3
+    np.testing.assert_allclose(late.values[:2, 0], 11.5)
+    assert np.isnan(late.values[2, 0])
+
+
+def test_collocate_station_grid():
+    paired = collocate_station_grid(_grid(), _records(), _metadata(), max_distance=0.5)
+
+    # only the days of both, at the station cells
+    assert (paired['time'].values == pd.date_range('2012-07-01', periods=2).values).all()
+    np.testing.assert_allclose(paired['grid'].sel(station='kumkoy').values, [11, 111])
+    np.testing.assert_allclose(paired['obs'].sel(station='kumkoy').values, 10.5)
+    assert paired['landuse'].values.tolist() == ['nourban', 'urban', 'nourban']
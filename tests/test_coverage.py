@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from utils.coverage import (build_coverage_index, count_pixels_per_class, count_valid_per_class,
+                            count_valid_per_pixel, coverage_path, open_coverage_index)
+
+
+def _lst():
+    # 4 days of a 3 x 3 grid (9 pixels: the bitmask spans 2 bytes)
+    values = np.full((4, 3, 3), 300.0, dtype='float32')
+    values[0, 0, 0] = np.nan
+    values[1, :, 2] = np.nan
+    values[3] = np.nan
+    return xr.DataArray(values, dims=('time', 'y', 'x'),
+                        coords={'time': pd.to_datetime(['2011-01-31', '2011-02-01',
+                                                        '2011-02-02', '2012-02-01']),
+                                'y': [2, 1, 0], 'x': [0, 1, 2]})
+
+
+def test_coverage_path():
+    assert coverage_path('data/merged_2011_2018.nc') == 'data/merged_2011_2018_coverage.nc'
+
+
+def test_valid_bits(tmp_path):
+    path = str(tmp_path / 'coverage.nc')
+    cov = build_coverage_index(_lst(), path, batch=3)
+
+    assert cov['valid_bits'].shape == (4, 2)
+    assert cov['valid_bits'].values[0].tolist() == [0b01111111, 0b10000000]
+
+    # packed counts: the fill value marks missing pixels
+    counts = _lst().fillna(0).astype('uint16').assign_attrs({'_FillValue': 0})
+    xr.testing.assert_equal(build_coverage_index(counts)['valid_bits'], cov['valid_bits'])
+
+    cov = open_coverage_index(path)
+    np.testing.assert_array_equal(count_valid_per_pixel(cov, batch=3).values,
+                                  [[2, 3, 2], [3, 3, 2], [3, 3, 2]])
+
+    per_month = count_valid_per_pixel(cov, group='month')
+    assert per_month['month'].values.tolist() == [1, 2]
+    np.testing.assert_array_equal(per_month.sel(month=2).values, [[2, 2, 1]] * 3)
+
+
+def test_valid_per_class():
+    cov = build_coverage_index(_lst())
+    lu_class = np.array([[1, 1, 0], [1, 0, 0], [0, 0, 0]])
+
+    counts = count_valid_per_class(cov, lu_class, batch=3)
+    assert counts[1].tolist() == [2, 3, 3, 0]
+    assert counts[0].tolist() == [6, 3, 6, 0]
+    assert count_valid_per_class(cov, lu_class, group='year').loc[2011].tolist() == [8, 15]
+    assert count_pixels_per_class(lu_class).tolist() == [3, 6]
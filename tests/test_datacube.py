@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('rioxarray')
+shapely_geometry = pytest.importorskip('shapely.geometry')
+
+from utils import datacube  # noqa: E402
+
+GHS_CLASSES = [10, 11, 12, 13, 21, 22, 23, 30]
+URBAN_CLASSES = [21, 22, 23, 30]
+RURAL_CLASSES = [11, 12, 13]
+
+
+def _raster(values, x, y, crs, dims=('y', 'x'), coords=None):
+    coords = dict(coords or {})
+    coords.update({'x': x, 'y': y})
+    return xr.DataArray(values, dims=dims, coords=coords).rio.write_crs(crs)
+
+
+def _write_shapefile():
+    # province polygon inside the synthetic domain (lon/lat)
+    os.makedirs('data/shapefiles')
+    shapefile = gpd.GeoDataFrame({'IL': ['istanbul']},
+                                 geometry=[shapely_geometry.box(28.2, 40.8, 29.0, 41.2)],
+                                 crs=4326)
+    shapefile.to_file('data/shapefiles/Iller_HGK_6360_Kanun_Sonrasi.shp')
+
+
+def _write_chirts(years):
+    # yearly chirts files as written by download_chirts (undecoded T)
+    os.makedirs('data/common/chirts')
+    X = np.arange(27.5, 30.0, 0.05)
+    Y = np.arange(42.0, 40.0, -0.05)
+    for year in years:
+        n_days = len(pd.date_range(f'{year}-01-01', f'{year}-12-31'))
+        shape = (n_days, len(Y), len(X))
+        xr.Dataset({'tmax': (('T', 'Y', 'X'), np.full(shape, 30, dtype='float32')),
+                    'tmin': (('T', 'Y', 'X'), np.full(shape, 15, dtype='float32'))},
+                   coords={'T': np.arange(n_days), 'X': X, 'Y': Y}
+                   ).to_netcdf(f'data/common/chirts/chirts_{year}.nc')
+
+
+def _lst(province, start_year, end_year):
+    # daily 1 km grid in utm, already cropped around the province
+    times = pd.date_range('2011-01-01', '2012-12-31')
+    x = np.arange(580000, 680000, 1000.0) + 500
+    y = np.arange(4570000, 4520000, -1000.0) - 500
+    values = np.full((len(times), len(y), len(x)), 300, dtype='float32')
+    return _raster(values, x, y, 32635, dims=('time', 'y', 'x'), coords={'time': times})
+
+
+def _ghs(province, start_year, end_year):
+    # settlement classes on a finer mercator grid, two epochs
+    rng = np.random.default_rng(0)
+    x = np.arange(3.12e6, 3.24e6, 250.0)
+    y = np.arange(5.04e6, 4.96e6, -250.0)
+    values = rng.choice(GHS_CLASSES, size=(2, len(y), len(x))).astype('float32')
+    values[:, :, :len(x) // 2] = 30
+    return _raster(values, x, y, 3857, dims=('time', 'y', 'x'),
+                   coords={'time': pd.to_datetime(['2000', '2015'])})
+
+
+@pytest.fixture
+def province_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_shapefile()
+    _write_chirts([2011, 2012])
+
+    # synthetic retrievers, resampling of the real sources
+    for variable, retrieve_func in [('lst_terra', _lst), ('ghs', _ghs)]:
+        _, resampling, daily = datacube.DATACUBE_SOURCES[variable]
+        monkeypatch.setitem(datacube.DATACUBE_SOURCES, variable, (retrieve_func, resampling, daily))
+
+
+def test_build_datacube(province_data):
+    cube = datacube.build_datacube('istanbul', variables=['lst_terra', 'tmax', 'tmin', 'ghs'],
+                                   start_year=2011, end_year=2012,
+                                   urban_classes=URBAN_CLASSES, rural_classes=RURAL_CLASSES,
+                                   landuse_source='ghs')
+
+    # every variable on the lst grid
+    assert cube['tmax'].dims == ('time', 'y', 'x')
+    assert cube.sizes['x'] == 100 and cube.sizes['y'] == 50
+    assert cube.sizes['time'] == 731
+
+    mask = cube['province_mask'].values
+    assert mask.dtype == bool and 0 < mask.sum() < mask.size
+    for variable in ['lst_terra', 'tmax', 'tmin', 'ghs']:
+        values = cube[variable].values
+        assert np.isnan(values[..., ~mask]).all()
+
+    # chirts values survive the reprojection inside the province
+    assert np.allclose(cube['tmax'].isel(time=0).values[mask], 30, equal_nan=True)
+    assert np.nanmax(cube['tmax'].values) == 30
+
+    # classes stay classes, so all of them are classified
+    ghs = cube['ghs'].values[..., mask]
+    assert np.isin(ghs[~np.isnan(ghs)], GHS_CLASSES).all()
+    lu_class = cube['lu_class'].values[mask]
+    assert set(np.unique(lu_class[~np.isnan(lu_class)])) <= {0, 1}
+    assert (lu_class == 1).any()
+
+
+def test_retrieve_datacube_cache(province_data):
+    kwargs = dict(variables=['lst_terra', 'ghs'], start_year=2011, end_year=2012,
+                  landuse_source='ghs')
+
+    cube = datacube.retrieve_datacube('istanbul', urban_classes=URBAN_CLASSES,
+                                      rural_classes=RURAL_CLASSES, **kwargs)
+    assert cube['province_mask'].dtype == bool
+    assert cube.chunks['time'][0] == 366
+
+    # other classes are built into their own file, never served stale
+    path = datacube.datacube_path('istanbul', 'lst_terra', 2011, 2012, kwargs['variables'],
+                                  URBAN_CLASSES, RURAL_CLASSES, 'ghs')
+    other_path = datacube.datacube_path('istanbul', 'lst_terra', 2011, 2012, kwargs['variables'],
+                                        [30], RURAL_CLASSES, 'ghs')
+    assert path != other_path and os.path.exists(path)
+
+    other = datacube.retrieve_datacube('istanbul', urban_classes=[30],
+                                       rural_classes=RURAL_CLASSES, **kwargs)
+    assert os.path.exists(other_path)
+    assert (other['lu_class'] == 1).sum() < (cube['lu_class'] == 1).sum()
+
+
+def test_missing_chirts_years(province_data):
+    with pytest.raises(FileNotFoundError, match='2013'):
+        datacube.build_datacube('istanbul', variables=['lst_terra', 'tmax'],
+                                start_year=2011, end_year=2013)
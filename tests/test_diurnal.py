@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from utils.diurnal import _day_slots, build_station_cube, day_night_uhi, diurnal_composite
+
+
+def _records():
+    # hourly records around the end of february of 2011 and 2012 (leap)
+    dates = pd.date_range('2011-02-28', '2011-03-01 23:00', freq='h').append(
+        pd.date_range('2012-02-28', '2012-03-01 23:00', freq='h'))
+    hours = dates.hour.values.astype('float64')
+    dt = pd.DataFrame({'Date': dates, 'urban_a': hours + 2, 'rural_a': hours})
+    dt.loc[5, 'rural_a'] = np.nan
+
+    metadata = pd.DataFrame({'station': ['urban_a', 'rural_a'],
+                             'landuse': ['urban', 'nourban']})
+    return dt, metadata
+
+
+def test_day_slots():
+    dates = ['2011-02-28', '2011-03-01', '2012-02-29', '2012-03-01', '2011-12-31', '2012-12-31']
+    assert _day_slots(dates).tolist() == [58, 60, 59, 60, 365, 365]
+
+
+def test_build_station_cube():
+    dt, metadata = _records()
+    cube = build_station_cube(dt, metadata)
+
+    assert cube.shape == (2, 2, 366, 24) and cube.dtype == 'float32'
+    urban = cube.sel(station='urban_a')
+    np.testing.assert_array_equal(urban.sel(year=2012, day=59).values, np.arange(24) + 2)
+    # 29 february of 2011 is padding without a season
+    assert np.isnan(urban.sel(year=2011, day=59)).all()
+    assert pd.isnull(cube['season'].sel(year=2011, day=59).item())
+    assert cube['season'].sel(year=2012, day=59).item() == 'DJF'
+    assert np.isnan(cube.sel(station='rural_a', year=2011, day=58, hour=5))
+
+
+def test_composites():
+    dt, metadata = _records()
+    cube = build_station_cube(dt, metadata)
+
+    composite = diurnal_composite(cube, by='month')
+    assert composite['month'].values.tolist() == [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12]
+    # the missing hour does not bias the mean
+    np.testing.assert_allclose(composite.sel(station='rural_a', month=2).values, np.arange(24))
+    np.testing.assert_allclose(composite.sel(station='urban_a', month=3).values, np.arange(24) + 2)
+    assert np.isnan(composite.sel(month=7)).all()
+
+    season = diurnal_composite(cube, by='season')
+    assert season['season'].values.tolist() == ['DJF', 'MAM', 'JJA', 'SON']
+
+    uhi = day_night_uhi(cube, by=None)
+    np.testing.assert_allclose(uhi.values, [[2, 2]])
+    assert uhi.dims == ('group', 'period')
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+import time
+from calendar import isleap
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from utils import download
+
+
+class StandInServer:
+    """
+    Local http stand-in of the IRI data library serving
+        synthetic CHIRTS subsets; failures[(var, year)] lists
+        what the next requests of a subset get.
+    Subsets are written before serving, as hdf5 must not be
+        used by the handler and download threads at once.
+    """
+
+    def __init__(self, tmp_path, var_names=('tmax', 'tmin'), years=(2011, 2012), delay=0.2):
+        self.delay = delay
+        self.subsets = {}
+        for var_name in var_names:
+            for year in years:
+                n_days = 366 if isleap(year) else 365
+                for truncated in (False, True):
+                    self.subsets[var_name, year, truncated] = self._write_subset(
+                        tmp_path, var_name, year, n_days - 30 if truncated else n_days)
+
+        self.failures = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}/SOURCES/.UCSB/.CHIRTS'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _write_subset(tmp_path, var_name, year, n_days):
+        path = tmp_path / f'served_{var_name}_{year}_{n_days}.nc'
+        values = np.full((n_days, 3, 4), year % 100, dtype='float32')
+        xr.Dataset({var_name: (('T', 'Y', 'X'), values)},
+                   coords={'T': np.arange(n_days), 'Y': [41.0, 40.5, 40.0],
+                           'X': [28.0, 28.5, 29.0, 29.5]}).to_netcdf(path)
+        return path.read_bytes()
+
+    def handle(self, request):
+        var_name = re.search(r'/\.(\w+)/Y/', request.path).group(1)
+        year = int(re.search(r'%20(\d{4})%29', request.path).group(1))
+        with self.lock:
+            self.requests.append((var_name, year))
+            failure = self.failures.get((var_name, year), [])
+            failure = failure.pop(0) if failure else None
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        try:
+            # slow transfers overlap if the client is concurrent
+            time.sleep(self.delay)
+            if failure == 'unreachable':
+                request.send_error(503)
+                return
+
+            body = self.subsets[var_name, year, failure == 'truncated']
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/x-netcdf')
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    served = tmp_path / 'served'
+    served.mkdir()
+    server = StandInServer(served)
+    yield server
+    server.close()
+
+
+def _download(server, out_dir):
+    return download.download_chirts(['tmax', 'tmin'], 2011, 2012, out_dir=str(out_dir),
+                                    base_url=server.base_url, max_workers=2, retries=2,
+                                    backoff=0, timeout=10)
+
+
+def test_build_chirts_url():
+    url = download.build_chirts_url('tmax', 2012, base_url='http://chirts.test')
+    assert url.startswith('http://chirts.test/.tmax/Y/')
+    assert '%281%20Jan%202012%29%2831%20Dec%202012%29' in url and url.endswith('/data.nc')
+
+
+def test_concurrent_download(server, tmp_path):
+    out_dir = tmp_path / 'chirts'
+    paths = _download(server, out_dir)
+
+    # both workers transfer at the same time
+    assert server.max_active == 2
+    assert len(server.requests) == 4
+    assert paths == [str(out_dir / 'chirts_2011.nc'), str(out_dir / 'chirts_2012.nc')]
+
+
+def test_resume_after_failed_subset(server, tmp_path):
+    out_dir = tmp_path / 'chirts'
+
+    # first run: one subset is recovered by a retry, one fails for good
+    server.failures = {('tmax', 2011): ['truncated'],
+                       ('tmin', 2012): ['unreachable', 'unreachable']}
+    with pytest.raises(RuntimeError, match='tmin-2012'):
+        _download(server, out_dir)
+
+    assert sorted(server.requests) == [('tmax', 2011), ('tmax', 2011), ('tmax', 2012),
+                                       ('tmin', 2011), ('tmin', 2012), ('tmin', 2012)]
+    with open(out_dir / download.CHECKPOINT_NAME) as f:
+        assert sorted(map(tuple, json.load(f))) == [('tmax', 2011), ('tmax', 2012),
+                                                    ('tmin', 2011)]
+
+    # only complete years are merged, nothing half written is left
+    files = sorted(os.listdir(out_dir))
+    assert 'chirts_2011.nc' in files and 'chirts_2012.nc' not in files
+    assert 'chirts_tmin_2012.nc' not in files
+    assert not [f for f in files if f.endswith(('.part', '.download'))]
+    merged_2011 = os.path.getmtime(out_dir / 'chirts_2011.nc')
+
+    # resumed run: only the failed subset is requested again
+    server.requests.clear()
+    paths = _download(server, out_dir)
+
+    assert server.requests == [('tmin', 2012)]
+    assert paths == [str(out_dir / 'chirts_2011.nc'), str(out_dir / 'chirts_2012.nc')]
+    assert os.path.getmtime(out_dir / 'chirts_2011.nc') == merged_2011
+
+    with xr.open_dataset(paths[1], decode_times=False) as dt:
+        assert set(dt.data_vars) == {'tmax', 'tmin'}
+        assert dt.sizes['T'] == 366
+        assert float(dt['tmin'].mean()) == 12
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from utils.events import detect_heatwaves
+
+
+def _series(hot_days, start='2011-12-01', end='2012-12-31', n_pixels=2):
+    # 20 degrees with 35 degree days on hot_days, on every pixel
+    times = pd.date_range(start, end)
+    values = np.full((len(times), n_pixels), 20.0)
+    values[times.isin(pd.to_datetime(hot_days))] = 35
+    return xr.DataArray(values, dims=('time', 'pixel'), coords={'time': times})
+
+
+@pytest.mark.parametrize('chunks', [None, {'time': 10, 'pixel': 1}])
+def test_heatwave_across_new_year(chunks):
+    hot_days = pd.date_range('2011-12-30', '2012-01-03').append(
+        pd.DatetimeIndex(['2012-07-01', '2012-07-02']))
+    dt = _series(hot_days)
+    dt = dt.chunk(chunks) if chunks else dt
+
+    events = detect_heatwaves(dt, min_duration=3, threshold=30).compute()
+
+    # one 5-day event, counted in the year it starts in
+    assert events['year'].values.tolist() == [2011, 2012]
+    assert events['event_count'].sel(pixel=0).values.tolist() == [1, 0]
+    assert events['heatwave_days'].sel(pixel=0).values.tolist() == [5, 0]
+    # the 2-day run of july is the longest one starting in 2012
+    assert events['max_duration'].sel(pixel=1).values.tolist() == [5, 2]
+
+
+def test_per_pixel_threshold(tmp_path):
+    dt = _series(pd.date_range('2012-06-01', '2012-06-04'))
+    threshold = xr.DataArray([30.0, 40.0], dims='pixel')
+
+    events = detect_heatwaves(dt, min_duration=3, threshold=threshold)
+
+    assert events.sel(year=2012)['event_count'].values.tolist() == [1, 0]
+    assert events.attrs['threshold'] == 'per-pixel'
+    events.to_netcdf(tmp_path / 'events.nc')
+    assert detect_heatwaves(dt, min_duration=3, threshold=30).attrs['threshold'] == 30
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+da = pytest.importorskip('dask.array')
+
+from utils.fusion import SOURCE_FLAGS, fill_gaps_linear, fuse_terra_aqua  # noqa: E402
+
+
+class CountingArray:
+    """
+    numpy array counting the reads dask makes of it.
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self.shape = values.shape
+        self.dtype = values.dtype
+        self.ndim = values.ndim
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return self.values[key]
+
+
+def _sensor(values, start='2012-01-25'):
+    times = pd.date_range(start, periods=values.shape[0])
+    return xr.DataArray(values, dims=('time', 'y', 'x'),
+                        coords={'time': times, 'y': np.arange(values.shape[1]),
+                                'x': np.arange(values.shape[2])})
+
+
+def _sensors(n_days=20, shape=(4, 6)):
+    rng = np.random.default_rng(0)
+    terra = (300 + rng.normal(size=(n_days,) + shape)).astype('float32')
+    aqua = terra - 2
+    terra[rng.random(terra.shape) < 0.3] = np.nan
+    aqua[rng.random(aqua.shape) < 0.3] = np.nan
+    return terra, aqua
+
+
+def test_fill_gaps_linear():
+    values = np.array([np.nan, 1, np.nan, np.nan, 4, np.nan, np.nan, np.nan, np.nan, 9, np.nan],
+                      dtype='float32')
+    flags = np.ones(values.shape, dtype='uint8')
+
+    fill_gaps_linear(values, flags, max_gap=2)
+
+    # the 2-day gap is filled, the 4-day gap and both edges are not
+    np.testing.assert_allclose(values[:5], [np.nan, 1, 2, 3, 4])
+    assert np.isnan(values[5:9]).all() and np.isnan(values[-1])
+    assert np.nonzero(flags == SOURCE_FLAGS['filled'])[0].tolist() == [2, 3]
+
+
+def test_fuse_terra_aqua():
+    terra = np.full((4, 1, 2), 300, dtype='float32')
+    aqua = terra - 2
+    terra[1] = np.nan
+    terra[2, 0, 0] = aqua[2, 0, 0] = np.nan
+
+    fused = fuse_terra_aqua(_sensor(terra), _sensor(aqua), bias_correction='mean', max_gap=1)
+
+    # aqua is shifted by the overpass bias, the common gap is interpolated
+    np.testing.assert_allclose(fused['LST'].values, 300)
+    np.testing.assert_allclose(fused['overpass_bias'].values, 2)
+    assert fused['source'].values[:, 0, 0].tolist() == [1, 2, 3, 1]
+    assert fused['source'].values[:, 0, 1].tolist() == [1, 2, 1, 1]
+
+
+@pytest.mark.parametrize('bias_correction', ['monthly', None])
+def test_fuse_time_contiguous(bias_correction):
+    terra, aqua = _sensors()
+    expected = fuse_terra_aqua(_sensor(terra), _sensor(aqua[2:], '2012-01-27'),
+                               bias_correction=bias_correction, max_gap=3)
+
+    # time-contiguous inputs: full time series in 2 x 3 pixel chunks
+    terra_store, aqua_store = CountingArray(terra), CountingArray(aqua[2:])
+    terra_dt = _sensor(da.from_array(terra_store, chunks=(-1, 2, 3)))
+    aqua_dt = _sensor(da.from_array(aqua_store, chunks=(-1, 2, 3)), '2012-01-27')
+    terra_store.reads = aqua_store.reads = 0
+    fused = fuse_terra_aqua(terra_dt, aqua_dt, bias_correction=bias_correction,
+                            max_gap=3, batch=8)
+
+    xr.testing.assert_allclose(fused, expected)
+    # every chunk is read once
+    assert terra_store.reads == aqua_store.reads == 4
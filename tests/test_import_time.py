@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import budget of utils and all of its submodules (seconds)
+IMPORT_BUDGET = 3.0
+
+# must not be imported until a function needs them
+HEAVY_MODULES = ['geopandas', 'rioxarray', 'pyproj', 'shapely',
+                 'cartopy', 'proplot', 'seaborn']
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import utils
+for name in utils._submodules:
+    getattr(utils, name)
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed,
+                  'modules': sorted(sys.modules),
+                  'submodules': utils._submodules}))
+"""
+
+# what the notebooks do
+STAR_IMPORT_SCRIPT = """
+import json
+from utils._lazy import LazyModule
+from utils.data import *
+from utils.utils import *
+from utils.visualization_codes import *
+print(json.dumps({'placeholders': sorted(name for name, value in dict(globals()).items()
+                                         if isinstance(value, LazyModule))}))
+"""
+
+# importing the package leaves xarray and the import system alone
+SIDE_EFFECT_SCRIPT = """
+import json, sys
+import xarray as xr
+meta_path = list(sys.meta_path)
+import utils
+for name in utils._submodules:
+    getattr(utils, name)
+print(json.dumps({'meta_path': sys.meta_path == meta_path,
+                  'rio': hasattr(xr.DataArray, 'rio') or hasattr(xr.Dataset, 'rio')}))
+"""
+
+
+def _run(script):
+    result = subprocess.run([sys.executable, '-c', script], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_within_budget():
+    result = _run(IMPORT_SCRIPT)
+    assert result['elapsed'] < IMPORT_BUDGET, f"import took {result['elapsed']:.2f} s"
+
+
+def test_heavy_dependencies_not_imported():
+    modules = _run(IMPORT_SCRIPT)['modules']
+    loaded = [name for name in HEAVY_MODULES
+              if name in modules or any(module.startswith(f'{name}.') for module in modules)]
+    assert not loaded, f'imported on package import: {loaded}'
+
+
+def test_all_submodules_listed():
+    package_dir = os.path.join(REPO_ROOT, 'utils')
+    modules = {name[:-3] for name in os.listdir(package_dir)
+               if name.endswith('.py') and not name.startswith('_')}
+    assert modules == set(_run(IMPORT_SCRIPT)['submodules'])
+
+
+def test_star_imports():
+    result = _run(STAR_IMPORT_SCRIPT)
+    assert result['placeholders'] == []
+
+
+def test_import_side_effect_free():
+    result = _run(SIDE_EFFECT_SCRIPT)
+    assert result['meta_path']
+    assert not result['rio']
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+da = pytest.importorskip('dask.array')
+
+from utils import data, rechunk, utils  # noqa: E402
+
+SAMPLE_PATH = ('data/istanbul/modis/terra/'
+               'MOD11A1.A2011001.h20v04.006.2016048174242.psrpgscs_000501491268.LST_Day_1km.hdf')
+
+
+def _packed(values=((0, 15000), (14000, 16000))):
+    # raw counts as opened by open_modis_tile(packed=True)
+    counts = np.array(values, dtype='uint16')[None]
+    return xr.DataArray(counts, dims=('time', 'y', 'x'), name='LST_Day_1km',
+                        coords={'time': pd.to_datetime(['2011-01-01']),
+                                'y': [4.5e6, 4.499e6], 'x': [2.2e6, 2.201e6]},
+                        attrs={'scale_factor': 0.02, '_FillValue': 0, 'units': 'K'})
+
+
+def test_decode_modis():
+    decoded = utils.decode_modis(_packed())
+    assert decoded.dtype == 'float32'
+    np.testing.assert_allclose(decoded.values, [[[np.nan, 300], [280, 320]]])
+    assert decoded.attrs == {'units': 'K'}
+
+    # lazy on dask data, decoded data is left alone
+    lazy = utils.decode_modis(_packed().chunk())
+    assert lazy.chunks is not None
+    np.testing.assert_allclose(lazy.values, decoded.values)
+    assert utils.decode_modis(decoded) is decoded
+
+
+def test_packed_round_trip(tmp_path):
+    path = utils.write_modis_packed(_packed(), str(tmp_path / 'merged.nc'))
+
+    raw = xr.open_dataset(path, mask_and_scale=False)['LST_Day_1km']
+    assert raw.dtype == 'uint16'
+    np.testing.assert_array_equal(raw.values, _packed().values)
+
+    # decoded as float32, not float64
+    decoded = xr.open_dataset(path)['LST_Day_1km']
+    assert decoded.dtype == 'float32'
+    np.testing.assert_allclose(decoded.values, utils.decode_modis(_packed()).values)
+
+    # the time-contiguous copy stays packed
+    time_path = rechunk.rechunk_time_contiguous(xr.open_dataset(path, mask_and_scale=False),
+                                                rechunk.time_contiguous_path(path))
+    copy = rechunk.open_time_contiguous(time_path)['LST_Day_1km']
+    assert copy.encoding['dtype'] == 'uint16' and copy.dtype == 'float32'
+    np.testing.assert_allclose(copy.values, decoded.values)
+    raw_copy = rechunk.open_time_contiguous(time_path, mask_and_scale=False)['LST_Day_1km']
+    np.testing.assert_array_equal(raw_copy.values, raw.values)
+
+    with pytest.raises(ValueError, match='packed=True'):
+        utils.write_modis_packed(decoded, str(tmp_path / 'float.nc'))
+
+
+def test_retrieve_modis_merged(tmp_path, monkeypatch):
+    pytest.importorskip('rioxarray')
+    monkeypatch.chdir(tmp_path)
+
+    # sample granule the crs is taken from
+    os.makedirs(os.path.dirname(SAMPLE_PATH))
+    _packed().isel(time=0).rio.write_crs(utils.MODIS_SINUSOIDAL).rio.to_raster(SAMPLE_PATH,
+                                                                               driver='GTiff')
+
+    general_path = 'data/istanbul/modis/terra/merged_2011_2018.nc'
+    utils.write_modis_packed(_packed(), general_path)
+
+    packed = data.retrieve_modis_merged('istanbul', 'terra', packed=True)
+    assert packed.dtype == 'uint16'
+    assert packed.attrs['_FillValue'] == 0 and packed.attrs['scale_factor'] == np.float32(0.02)
+    assert packed.rio.crs is not None
+
+    decoded = data.retrieve_modis_merged('istanbul', 'terra')
+    assert decoded.dtype == 'float32'
+    np.testing.assert_allclose(utils.decode_modis(packed).values, decoded.values)
+
+    # float caches cannot be served packed
+    float_dt = xr.open_dataset(general_path).load()
+    float_dt['LST_Day_1km'].encoding = {}
+    float_dt.to_netcdf('float.nc')
+    os.replace('float.nc', general_path)
+    with pytest.raises(ValueError, match='write_modis_merged'):
+        data.retrieve_modis_merged('istanbul', 'terra', packed=True)
+
+
+def test_missing_tile_granules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data/izmir/modis/terra')
+    open('data/izmir/modis/terra/MOD11A1.A2011001.h20v04.006.hdf', 'w').close()
+
+    assert data.find_tile_granules('izmir', 'terra', 'h20v04')
+    with pytest.raises(FileNotFoundError, match='h20v05'):
+        data.find_tile_granules('izmir', 'terra', 'h20v05')
+    with pytest.raises(FileNotFoundError, match='h20v05'):
+        next(data.iter_modis_granules('izmir', 'terra', 'h20v05'))
+
+
+def test_write_modis_provinces(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reads = []
+
+    def read_granule(block, block_info=None):
+        # stands in for a granule read, one granule per day
+        reads.append(block_info[None]['chunk-location'][0])
+        return np.where(block % 7 == 0, 0, block % 5000 + 14000).astype('uint16')
+
+    n_days = 12
+    counts = da.arange(n_days * 20 * 30, chunks=20 * 30).reshape(n_days, 20, 30)
+    counts = counts.map_blocks(read_granule, dtype='uint16', meta=np.array((), dtype='uint16'))
+    tile = xr.DataArray(counts, dims=('time', 'y', 'x'), name='LST_Day_1km',
+                        coords={'time': pd.date_range('2011-01-01', periods=n_days)},
+                        attrs={'scale_factor': 0.02, '_FillValue': 0})
+
+    # two provinces cut from the same tile
+    province_dt = {'west': tile.isel(x=slice(0, 15)), 'east': tile.isel(x=slice(10, 30))}
+    monkeypatch.setattr(data, 'retrieve_modis_provinces',
+                        lambda provinces, source_type, packed: province_dt)
+
+    # about five days of both provinces per block
+    paths = data.write_modis_provinces(source_type='terra', time_contiguous=False,
+                                       memory_limit=f'{5 * 20 * 35 * 2}B')
+
+    assert sorted(reads) == list(range(n_days))
+    assert os.listdir('data/west/modis/terra') == ['merged_2011_2018.nc']
+
+    expected = tile.values
+    west = xr.open_dataset(paths['west'], mask_and_scale=False)['LST_Day_1km']
+    assert west.dtype == 'uint16'
+    np.testing.assert_array_equal(west.values, expected[..., :15])
+    np.testing.assert_array_equal(west['time'].values, tile['time'].values)
+
+    east = xr.open_dataset(paths['east'])['LST_Day_1km']
+    decoded = np.where(expected == 0, np.nan, expected * 0.02)[..., 10:]
+    np.testing.assert_allclose(east.values, decoded, rtol=1e-6)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+pytest.importorskip('scipy')
+
+from utils.pairing import pair_urban_rural, paired_uhi  # noqa: E402
+
+
+def _grid(values, dims=('y', 'x')):
+    values = np.asarray(values, dtype='float32')
+    coords = {'y': np.arange(values.shape[-2])[::-1], 'x': np.arange(values.shape[-1])}
+    if values.ndim == 3:
+        dims = ('time',) + dims
+        coords['time'] = np.arange(values.shape[0])
+    return xr.DataArray(values, dims=dims, coords=coords)
+
+
+def test_paired_uhi():
+    # one urban pixel in the middle of a row, 2 rural neighbours within 1
+    lu_class = _grid([[0, 1, 0, 0]])
+    pairs = pair_urban_rural(lu_class, radius=1)
+
+    assert pairs['urban_idx'].tolist() == [1]
+    assert pairs['rural_idx'][pairs['pair_rural']].tolist() == [0, 2]
+    assert pairs['weights'].toarray().tolist() == [[1, 1, 0]]
+
+    # mean of the valid rural neighbours of each day
+    lst = _grid([[[300, 304, 302, 350]], [[np.nan, 304, 301, 350]]])
+    uhi = paired_uhi(lst, pairs, per_pair=True)
+
+    np.testing.assert_allclose(uhi['uhi'].values, [3, 3])
+    assert uhi['n_rural'].values.tolist() == [2]
+    np.testing.assert_allclose(uhi['uhi_pair'].values, [[4, 2], [np.nan, 3]])
+
+
+def test_elevation_limit():
+    lu_class = _grid([[0, 1, 0]])
+    elevation = _grid([[10, 0, 200]])
+
+    pairs = pair_urban_rural(lu_class, radius=1, elevation=elevation,
+                             max_elevation_difference=50)
+    assert pairs['rural_idx'][pairs['pair_rural']].tolist() == [0]
+
+
+def test_no_rural_pixels():
+    with pytest.raises(ValueError, match='No rural pixels'):
+        pair_urban_rural(_grid([[1, 1], [1, 1]]), radius=1)
+
+    # no urban pixels: no pairs
+    pairs = pair_urban_rural(_grid([[0, 0], [0, 0]]), radius=1)
+    assert pairs['weights'].shape == (0, 4) and not len(pairs['pair_urban'])
@@ -0,0 +1,38 @@
+import threading
+
+import numpy as np
+
+from utils.utils import prefetch
+
+
+def _loader(item_bytes):
+    # records which items are loaded before the consumer gets them
+    started = []
+    lock = threading.Lock()
+
+    def load(item):
+        with lock:
+            started.append(item)
+        return np.zeros(item_bytes, dtype='uint8')
+
+    return load, started
+
+
+def test_prefetch_order():
+    load, started = _loader(10)
+    assert [item for item, _ in prefetch(range(6), load, ahead=3)] == list(range(6))
+    assert sorted(started) == list(range(6))
+
+
+def test_prefetch_memory_limit():
+    # items larger than the limit: nothing is loaded in advance,
+    # not even before the size of the first item is known
+    load, started = _loader(1000)
+    for item, result in prefetch(range(5), load, ahead=4, memory_limit=500):
+        assert started == list(range(item + 1))
+        assert result.nbytes == 1000
+
+    # two items fit: the next one is loaded in advance
+    load, started = _loader(1000)
+    for item, _ in prefetch(range(5), load, ahead=4, max_workers=1, memory_limit=2000):
+        assert len(started) <= (1 if item == 0 else min(item + 2, 5))
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from utils.qc import QC_FLAGS, apply_qc, quality_control
+
+
+def _records(n_hours=24):
+    # 4 stations following the same daily cycle with small noise
+    rng = np.random.default_rng(1)
+    base = 25 + 5 * np.sin(np.arange(n_hours) / 24 * 2 * np.pi)
+    dt = pd.DataFrame({station: base + offset + rng.normal(0, 0.3, n_hours)
+                       for station, offset in zip('ABCD', (0, 1, -1, 0.5))})
+    dt.insert(0, 'Date', pd.date_range('2012-07-01', periods=n_hours, freq='h'))
+
+    dt.loc[3, 'A'] = np.nan
+    dt.loc[10, 'A'] = 60
+    dt.loc[5, 'B'] += 10
+    dt.loc[12:17, 'C'] = 20
+    return dt
+
+
+def _flagged(flags, station, check):
+    return np.flatnonzero(flags[station].values & QC_FLAGS[check]).tolist()
+
+
+def test_quality_control_flags():
+    flags, summary = quality_control(_records(), 'ABCD')
+
+    assert flags['A'].tolist()[:11] == [0, 0, 0, QC_FLAGS['missing']] + [0] * 6 + [QC_FLAGS['range']]
+    # the spike is a step up and a step down, and off the other stations
+    assert flags['B'][5] == QC_FLAGS['step'] | QC_FLAGS['spike'] | QC_FLAGS['consistency']
+    assert flags['B'][6] == QC_FLAGS['step']
+    # the whole flat window is flagged
+    assert _flagged(flags, 'C', 'persistence') == list(range(12, 18))
+    assert not flags['D'].any()
+
+    assert summary.loc['A', 'n_valid'] == 23
+    assert summary.loc['B', ['step', 'spike']].tolist() == [2, 1]
+    assert summary.loc['D', 'flagged_fraction'] == 0
+
+
+def test_checks_skip_gaps():
+    # a jump across a missing hour is not a step
+    dt = _records().drop(index=[4, 6])
+    flags, _ = quality_control(dt, 'ABCD')
+    assert not _flagged(flags, 'B', 'step') and not _flagged(flags, 'B', 'spike')
+
+
+def test_apply_qc():
+    dt = _records()
+    flags, _ = quality_control(dt, 'ABCD')
+
+    cleaned = apply_qc(dt, flags, checks=('range', 'spike'))
+    assert np.isnan(cleaned.loc[[3, 10], 'A']).all() and np.isnan(cleaned.loc[5, 'B'])
+    # only the chosen checks are applied
+    assert cleaned.loc[6, 'B'] == dt.loc[6, 'B']
+    assert cleaned['C'].equals(dt['C'])
@@ -0,0 +1,85 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from utils import rechunk
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# allowance for the netcdf/hdf5 stack besides the blocks
+MEMORY_OVERHEAD = 16 * 2**20
+
+# peak memory of write_chirts_time_contiguous in a fresh process
+PEAK_SCRIPT = """
+import json, sys
+sys.path.insert(0, {repo_root!r})
+import dask.array, xarray as xr
+from utils.data import write_chirts_time_contiguous
+
+# warm up the netcdf stack on a single row
+with xr.open_dataset('data/common/chirts/chirts_2011.nc') as dt:
+    dt.isel(Y=0).chunk().to_netcdf('warmup.nc')
+
+def memory(field):
+    with open('/proc/self/status') as f:
+        kb = next(line.split()[1] for line in f if line.startswith(field))
+    return int(kb) * 1024
+
+# peak resident memory is reset to the current one
+with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+base = memory('VmRSS')
+path = write_chirts_time_contiguous(2011, 2013, memory_limit={memory_limit!r})
+print(json.dumps({{'path': path, 'peak': memory('VmHWM') - base}}))
+"""
+
+
+def _write_chirts(years, shape=(80, 300)):
+    # yearly chirts files as written by download_chirts
+    os.makedirs('data/common/chirts')
+    rng = np.random.default_rng(0)
+    X = 26 + np.arange(shape[1]) * 0.05
+    Y = 42 - np.arange(shape[0]) * 0.05
+    for year in years:
+        n_days = len(pd.date_range(f'{year}-01-01', f'{year}-12-31'))
+        values = 20 + rng.integers(0, 100, (n_days,) + shape).astype('float32') / 10
+        xr.Dataset({'tmax': (('T', 'Y', 'X'), values)},
+                   coords={'T': np.arange(n_days), 'Y': Y, 'X': X}
+                   ).to_netcdf(f'data/common/chirts/chirts_{year}.nc')
+
+
+def test_find_row_block():
+    # 8 rows fit, rounded down to whole chunk rows of 4
+    assert rechunk.find_row_block(100, 50, 10, 4, 4 * 8 * 100 * 10 * 4, (4, 4)) == 8
+    # not even one chunk row fits: the chunk row shrinks
+    assert rechunk.find_row_block(100, 50, 10, 4, 4 * 3 * 100 * 10 * 4, (4, 4)) == 3
+    # at least one row
+    assert rechunk.find_row_block(100, 50, 10, 4, 1, (4, 4)) == 1
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/clear_refs'), reason='needs linux procfs')
+def test_chirts_time_copy_memory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_chirts([2011, 2012, 2013])
+    memory_limit = 16 * 2**20
+
+    script = PEAK_SCRIPT.format(repo_root=REPO_ROOT, memory_limit=memory_limit)
+    result = subprocess.run([sys.executable, '-c', script], cwd=tmp_path,
+                            capture_output=True, text=True, check=True)
+    result = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # a year is 35MB, the whole input 105MB
+    assert result['peak'] < memory_limit + MEMORY_OVERHEAD, f"peak {result['peak'] / 2**20:.0f}MB"
+
+    # same values, one chunk holds the full series of a pixel
+    copy = rechunk.open_time_contiguous(result['path'], time_dim='T', x_dims='X', y_dims='Y')
+    assert copy['tmax'].encoding['chunksizes'][0] == copy.sizes['T'] == 1096
+    assert copy['tmax'].chunks[0] == (1096,)
+    with xr.open_dataset('data/common/chirts/chirts_2012.nc') as year:
+        np.testing.assert_array_equal(copy['tmax'].sel(T='2012').values, year['tmax'].values)
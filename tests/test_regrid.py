@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+pytest.importorskip('rioxarray')
+pytest.importorskip('pyproj')
+pytest.importorskip('scipy')
+
+from utils.regrid import (build_overlap_weights, calculate_class_fractions,  # noqa: E402
+                          classify_by_fraction, regrid_area_weighted)
+
+
+def _fine(values):
+    # 4 x 4 cells of 0.1 degree
+    return xr.DataArray(np.asarray(values, dtype='float64'), dims=('y', 'x'),
+                        coords={'y': [41.35, 41.25, 41.15, 41.05],
+                                'x': [28.05, 28.15, 28.25, 28.35]}).rio.write_crs(4326)
+
+
+def _coarse(x0=28.1, y0=41.3):
+    # 2 x 2 cells of 0.2 degree, the first centred at (x0, y0)
+    return xr.DataArray(np.zeros((2, 2)), dims=('Y', 'X'),
+                        coords={'Y': [y0, y0 - 0.2], 'X': [x0, x0 + 0.2]}).rio.write_crs(4326)
+
+
+def test_overlap_weights():
+    overlap = build_overlap_weights(_fine(np.zeros((4, 4))), _coarse())
+    weights = overlap['weights'].toarray()
+
+    # every coarse cell holds 2 x 2 whole fine cells
+    assert weights.shape == (4, 16)
+    np.testing.assert_allclose(weights.sum(axis=1), 4)
+    np.testing.assert_allclose(weights[0].reshape(4, 4), [[1, 1, 0, 0], [1, 1, 0, 0],
+                                                          [0, 0, 0, 0], [0, 0, 0, 0]])
+
+    # half a fine cell off: only parts of the border cells overlap
+    shifted = build_overlap_weights(_fine(np.zeros((4, 4))), _coarse(28.15, 41.25))
+    np.testing.assert_allclose(shifted['weights'].toarray()[0].reshape(4, 4),
+                               np.outer([.5, 1, .5, 0], [.5, 1, .5, 0]))
+
+def test_regrid_area_weighted():
+    values = np.arange(16.0).reshape(4, 4)
+    values[0, 0] = np.nan
+    fine = _fine(values).expand_dims(time=[0, 1]) * xr.DataArray([1, 2], dims='time')
+
+    mean = regrid_area_weighted(fine, build_overlap_weights(_fine(values), _coarse()))
+
+    # nan cells are left out of the mean
+    assert mean.dims == ('Y', 'X', 'time')
+    np.testing.assert_allclose(mean.sel(time=0).values, [[(1 + 4 + 5) / 3, 4.5], [10.5, 12.5]])
+    np.testing.assert_allclose(mean.sel(time=1).values, 2 * mean.sel(time=0).values)
+
+
+def test_class_fractions():
+    lu_data = _fine([[21, 21, 11, 11],
+                     [21, np.nan, 11, 30],
+                     [11, 11, 50, 50],
+                     [11, 11, 50, 50]])
+    overlap = build_overlap_weights(lu_data, _coarse())
+
+    fractions = calculate_class_fractions(lu_data, overlap, {'urban': [21, 30], 'rural': [11]})
+    np.testing.assert_allclose(fractions['urban'].values, [[1, .25], [0, 0]])
+    np.testing.assert_allclose(fractions['rural'].values, [[0, .75], [1, 0]])
+
+    lu_class = classify_by_fraction(fractions)
+    np.testing.assert_array_equal(lu_class.values, [[1, 0], [0, np.nan]])
@@ -0,0 +1,69 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+import xarray as xr
+
+pytest.importorskip('rioxarray')
+
+from utils.shared import (attach_province_cube, attach_shared_cube,  # noqa: E402
+                          cached_province_cube, export_province_cube, export_shared_cube)
+
+
+def _cube():
+    values = np.arange(2 * 3 * 4, dtype='float32').reshape(2, 3, 4)
+    return xr.DataArray(values, dims=('band', 'y', 'x'), name='ghs',
+                        coords={'band': [1, 2], 'y': [41.2, 41.1, 41.0],
+                                'x': [28.0, 28.1, 28.2, 28.3], 'label': ('band', ['a', 'b'])},
+                        attrs={'scale': np.float32(2)}).rio.write_crs(4326)
+
+
+def _shared_sum(handle):
+    # runs in a worker process
+    dt, shm = attach_shared_cube(handle)
+    total = float(dt.sum())
+    del dt
+    shm.close()
+    return total
+
+
+def test_province_cube_round_trip(tmp_path):
+    path = export_province_cube(_cube().chunk({'band': 1}), str(tmp_path / 'ghs'))
+    dt = attach_province_cube(path)
+
+    # values are memory-mapped, not read
+    assert isinstance(dt.data, np.memmap) and not dt.data.flags.writeable
+    xr.testing.assert_identical(dt.drop_vars('spatial_ref'), _cube().drop_vars('spatial_ref'))
+    assert dt.rio.crs.to_epsg() == 4326
+
+
+def test_cached_province_cube(tmp_path):
+    calls = []
+
+    def retrieve(province):
+        calls.append(province)
+        return _cube()
+
+    path = str(tmp_path / 'istanbul')
+    first = cached_province_cube(retrieve, path, 'istanbul')
+    second = cached_province_cube(retrieve, path, 'istanbul')
+
+    assert calls == ['istanbul']
+    xr.testing.assert_identical(first, second)
+
+
+def test_shared_cube():
+    shm, handle = export_shared_cube(_cube())
+    try:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            totals = list(executor.map(_shared_sum, [handle, handle]))
+        assert totals == [float(_cube().sum())] * 2
+
+        # attached values are views of the shared block
+        dt, attached = attach_shared_cube(handle)
+        assert not dt.data.flags.owndata and dt.rio.crs.to_epsg() == 4326
+        del dt
+        attached.close()
+    finally:
+        shm.close()
+        shm.unlink()
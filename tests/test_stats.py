@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.stats import (block_bootstrap_indices, block_sign_flips, bootstrap_difference,
+                         bootstrap_mean_difference)
+
+
+def test_block_resamples():
+    rng = np.random.default_rng(0)
+    index = block_bootstrap_indices(10, 50, 4, rng)
+
+    # rows of 3 blocks of consecutive steps, cut to 10
+    assert index.shape == (50, 10) and index.min() >= 0 and index.max() <= 9
+    np.testing.assert_array_equal(np.diff(index[:, :4], axis=1), 1)
+    np.testing.assert_array_equal(np.diff(index[:, 8:], axis=1), 1)
+
+    signs = block_sign_flips(10, 50, 4, rng)
+    assert set(np.unique(signs)) == {-1, 1}
+    assert (signs[:, :4] == signs[:, [0]]).all() and (signs[:, 8:] == signs[:, [8]]).all()
+
+
+def test_bootstrap_difference():
+    # constant difference: a point interval, no sign flip reaches it
+    rural = np.arange(30.0)
+    urban = rural + 2
+    urban[3] = np.nan
+    result = bootstrap_difference(urban, rural, n_resamples=99)
+
+    assert result['n'] == 29 and result['diff'] == pytest.approx(2)
+    assert result['ci_low'] == pytest.approx(2) and result['ci_high'] == pytest.approx(2)
+    assert result['p_value'] == pytest.approx(1 / 100)
+
+    # no difference but noise: not significant, interval around 0
+    noise = np.random.default_rng(1).normal(size=200)
+    result = bootstrap_difference(noise, np.zeros(200), n_resamples=500, block_size=1)
+    assert result['ci_low'] < 0 < result['ci_high'] and result['p_value'] > 0.05
+
+    assert np.isnan(bootstrap_difference([np.nan], [1.0])['diff'])
+
+
+def test_bootstrap_mean_difference():
+    index = pd.date_range('2011-01-01', '2012-12-31')
+    noise = np.random.default_rng(2).normal(0, 0.5, len(index))
+    urban = pd.Series(20 + 1.5 * (index.year == 2012) + noise, index=index)
+    rural = pd.Series(20.0, index=index[10:])
+
+    results = bootstrap_mean_difference(urban, rural, n_resamples=200)
+
+    yearly = results['yearly']
+    assert yearly.index.tolist() == [2011, 2012]
+    assert yearly['n'].tolist() == [355, 366]
+    assert yearly.loc[2012, 'diff'] == pytest.approx(1.5, abs=0.1)
+    assert yearly.loc[2012, 'ci_low'] > 1 and yearly.loc[2012, 'p_value'] < 0.05
+    assert results['seasonal'].index.tolist() == ['DJF', 'MAM', 'JJA', 'SON']
+    assert results['monthly'].index.tolist() == list(range(1, 13))
+
+    # every group has its own seed: same results on processes
+    parallel = bootstrap_mean_difference(urban, rural, mean_types=('yearly',),
+                                         n_resamples=200, n_jobs=2)
+    pd.testing.assert_frame_equal(parallel['yearly'], yearly)
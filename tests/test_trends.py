@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+stats = pytest.importorskip('scipy.stats')
+
+from utils.trends import calculate_trend, time_to_years  # noqa: E402
+
+
+def _series(n_years=12, n_pixels=5):
+    # yearly series with per-pixel trends, noise and a missing year
+    rng = np.random.default_rng(3)
+    years = np.arange(2000, 2000 + n_years)
+    values = 0.1 * np.arange(n_pixels)[:, None] * (years - 2000) + rng.normal(size=(n_pixels, n_years))
+    values[1, 4] = np.nan
+    return xr.DataArray(values, dims=('pixel', 'time'),
+                        coords={'time': pd.to_datetime([f'{year}-01-01' for year in years])})
+
+
+def test_time_to_years():
+    times = pd.to_datetime(['2011-01-01', '2012-07-02', '2012-12-31'])
+    np.testing.assert_allclose(time_to_years(times.values), [2011, 2012.5, 2012 + 365 / 366])
+    np.testing.assert_array_equal(time_to_years(np.arange(3)), [0, 1, 2])
+
+
+def test_ols_trend():
+    dt = _series()
+    trend = calculate_trend(dt, method='ols')
+
+    for pixel in range(dt.sizes['pixel']):
+        series = dt[pixel].dropna('time')
+        expected = stats.linregress(series['time'].dt.year, series.values)
+        assert trend['slope'][pixel] == pytest.approx(expected.slope, rel=1e-5)
+        assert trend['p_value'][pixel] == pytest.approx(expected.pvalue, rel=1e-4)
+
+    # dask chunks along time are merged
+    lazy = calculate_trend(dt.chunk({'pixel': 2, 'time': 4}), method='ols').compute()
+    xr.testing.assert_allclose(lazy, trend)
+
+
+def test_theil_sen_trend():
+    dt = _series()
+    trend = calculate_trend(dt, method='theil_sen')
+
+    for pixel in range(dt.sizes['pixel']):
+        series = dt[pixel].dropna('time')
+        expected = stats.theilslopes(series.values, series['time'].dt.year)
+        assert trend['slope'][pixel] == pytest.approx(expected.slope, rel=1e-5)
+
+
+def test_mann_kendall():
+    # strictly increasing: S = n(n-1)/2, continuity corrected z
+    n = 10
+    dt = xr.DataArray(np.arange(n, dtype='float64') ** 2, dims='time', coords={'time': np.arange(n)})
+    trend = calculate_trend(dt, method='theil_sen')
+
+    s_stat = n * (n - 1) / 2
+    z = (s_stat - 1) / np.sqrt(n * (n - 1) * (2 * n + 5) / 18)
+    assert trend['p_value'] == pytest.approx(2 * stats.norm.sf(z), rel=1e-5)
+    assert bool(trend['significant'])
+
+
+def test_theil_sen_needs_resample():
+    dt = xr.DataArray(np.arange(500.0), dims='time',
+                      coords={'time': pd.date_range('2011-01-01', periods=500)})
+    with pytest.raises(ValueError, match='resample'):
+        calculate_trend(dt, method='theil_sen')
+
+    trend = calculate_trend(dt, method='theil_sen', resample='1MS')
+    assert trend['slope'] == pytest.approx(365.25, rel=0.01)
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+gpd = pytest.importorskip('geopandas')
+pytest.importorskip('rioxarray')
+shapely_geometry = pytest.importorskip('shapely.geometry')
+
+from utils import zonal  # noqa: E402
+
+
+def _grid(x0, values=None):
+    # 10 x 10 lon/lat grid of 0.1 degree pixels starting at x0
+    x = x0 + 0.05 + np.arange(10) * 0.1
+    y = 41.45 - np.arange(10) * 0.1
+    times = pd.date_range('2011-01-01', periods=3)
+    values = np.ones((3, 10, 10)) if values is None else values
+    return xr.DataArray(values, dims=('time', 'y', 'x'),
+                        coords={'time': times, 'x': x, 'y': y}).rio.write_crs(4326)
+
+
+@pytest.fixture
+def districts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data/shapefiles')
+    shapefile = gpd.GeoDataFrame({'ILCE': ['fatih', 'kadikoy']},
+                                 geometry=[shapely_geometry.box(28.0, 40.5, 28.5, 41.5),
+                                           shapely_geometry.box(28.5, 40.5, 29.0, 41.5)],
+                                 crs=4326)
+    shapefile.to_file('data/shapefiles/istanbul_ankara_izmir_shapefile.shp')
+
+
+def test_label_cache_checks_grid(districts):
+    dt = _grid(28.0)
+    labels = zonal.retrieve_district_labels(dt, 'modis_istanbul')
+    assert os.path.exists('data/shapefiles/district_labels_modis_istanbul.nc')
+    assert (labels['label'].values > 0).all()
+
+    # same source name and size, other clip: rebuilt, not served stale
+    shifted = _grid(28.5)
+    shifted_labels = zonal.retrieve_district_labels(shifted, 'modis_istanbul')
+    assert (shifted_labels['label'].values[:, :5] == 2).all()
+    assert (shifted_labels['label'].values[:, 5:] == 0).all()
+
+    cached = zonal.retrieve_district_labels(shifted, 'modis_istanbul')
+    np.testing.assert_array_equal(cached['label'].values, shifted_labels['label'].values)
+
+
+def test_zonal_statistics_checks_grid(districts):
+    values = np.broadcast_to(np.arange(10.0), (3, 10, 10)).copy()
+    dt = _grid(28.0, values)
+    labels = zonal.retrieve_district_labels(dt, 'modis_istanbul')
+
+    stats = zonal.zonal_statistics(dt, labels)
+    np.testing.assert_allclose(stats['mean'].sel(zone='fatih'), 2)
+    np.testing.assert_allclose(stats['mean'].sel(zone='kadikoy'), 7)
+
+    with pytest.raises(ValueError, match='coordinates'):
+        zonal.zonal_statistics(_grid(28.5, values), labels)
+    with pytest.raises(ValueError, match='shape'):
+        zonal.zonal_statistics(dt.isel(x=slice(0, 8)), labels)
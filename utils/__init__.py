@@ -0,0 +1,103 @@
+"""
+Data retrieval and analysis utilities of the paper.
+
+Submodules and the public functions below are imported
+    on first access, so `import utils` is cheap and heavy
+    geo / plotting dependencies load only when used.
+"""
+
+import importlib
+
+_submodules = ['collocation', 'coverage', 'data', 'datacube', 'diurnal', 'download',
+               'events', 'fusion', 'pairing', 'qc', 'rechunk', 'regrid', 'shared',
+               'stats', 'trends', 'utils', 'visualization_codes', 'zonal']
+
+# public function --> submodule
+_public_api = {
+    # data retrieval
+    'retrieve_dmsp': 'data',
+    'retrieve_population': 'data',
+    'retrieve_station': 'data',
+    'retrieve_corine': 'data',
+    'retrieve_modis': 'data',
+    'retrieve_modis_provinces': 'data',
+    'write_modis_provinces': 'data',
+    'retrieve_modis_merged': 'data',
+    'write_modis_merged': 'data',
+    'retrieve_modis_coverage': 'data',
+    'retrieve_ghs': 'data',
+    'retrieve_chirts': 'data',
+    'write_chirts_time_contiguous': 'data',
+    'iter_chirts_years': 'data',
+    'iter_modis_granules': 'data',
+    'clip_subroutine': 'data',
+    'find_province_tiles': 'data',
+    # helpers
+    'adjust_station_data': 'utils',
+    'calculate_yearly_mean': 'utils',
+    'calculate_seasonal_mean': 'utils',
+    'calculate_monthly_mean': 'utils',
+    'classify_urban_rural': 'utils',
+    'decode_modis': 'utils',
+    'define_index_correspondence': 'utils',
+    'find_grid_amount': 'utils',
+    'get_station_metadata': 'utils',
+    'get_turkish_city_names': 'utils',
+    'regrid_match': 'utils',
+    'reproject_modis_landuse_data': 'utils',
+    'prefetch': 'utils',
+    # analysis
+    'download_chirts': 'download',
+    'rechunk_time_contiguous': 'rechunk',
+    'calculate_trend': 'trends',
+    'calculate_uhi_anomaly': 'trends',
+    'build_coverage_index': 'coverage',
+    'count_valid_per_pixel': 'coverage',
+    'count_valid_per_class': 'coverage',
+    'export_province_cube': 'shared',
+    'attach_province_cube': 'shared',
+    'export_shared_cube': 'shared',
+    'attach_shared_cube': 'shared',
+    'collocate_stations': 'collocation',
+    'collocate_station_grid': 'collocation',
+    'pair_urban_rural': 'pairing',
+    'paired_uhi': 'pairing',
+    'build_overlap_weights': 'regrid',
+    'calculate_class_fractions': 'regrid',
+    'classify_by_fraction': 'regrid',
+    'bootstrap_mean_difference': 'stats',
+    'zonal_statistics': 'zonal',
+    'retrieve_district_labels': 'zonal',
+    'detect_heatwaves': 'events',
+    'heatwaves_per_class': 'events',
+    'station_daily_max': 'events',
+    'build_station_cube': 'diurnal',
+    'diurnal_composite': 'diurnal',
+    'missing_mask': 'diurnal',
+    'day_night_uhi': 'diurnal',
+    'quality_control': 'qc',
+    'apply_qc': 'qc',
+    'build_datacube': 'datacube',
+    'retrieve_datacube': 'datacube',
+    'retrieve_modis_fused': 'fusion',
+    'fuse_terra_aqua': 'fusion',
+    'fill_gaps_linear': 'fusion',
+}
+
+__all__ = _submodules + list(_public_api)
+
+
+def __getattr__(name):
+
+    if name in _submodules:
+        return importlib.import_module(f'{__name__}.{name}')
+
+    if name in _public_api:
+        module = importlib.import_module(f'{__name__}.{_public_api[name]}')
+        return getattr(module, name)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,44 @@
+import importlib
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder of a module that is imported on first
+        attribute access (heavy geo / plotting dependencies).
+    submodules are imported together with the module.
+    """
+
+    def __init__(self, name, submodules=()):
+        super().__init__(name)
+        self.__dict__['_submodules'] = submodules
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            for submodule in self._submodules:
+                importlib.import_module(f'{self.__name__}.{submodule}')
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name, submodules=()):
+    return LazyModule(name, submodules)
+
+
+def load_rioxarray():
+    """
+    Imports rioxarray so that the .rio accessor
+        of xarray objects is registered.
+    """
+
+    return importlib.import_module('rioxarray')
+
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+
+# heavy geo dependencies are imported on first use
+pyproj = lazy_import('pyproj')
+spatial = lazy_import('scipy.spatial')
+
+
+def build_grid_index(dt, x_dims='x', y_dims='y'):
+    """
+    Builds a KD-tree of the grid cell centres of dt
+        in its own crs (coordinate units).
+    """
+
+    xx, yy = np.meshgrid(dt[x_dims].values, dt[y_dims].values)
+
+    return spatial.cKDTree(np.column_stack([xx.ravel(), yy.ravel()]))
+
+
+def project_stations(metadata, crs, lon_col='x', lat_col='y'):
+    """
+    Projects station lon/lat (EPSG:4326; x and y columns
+        of get_station_metadata) onto the given crs.
+    """
+
+    transformer = pyproj.Transformer.from_crs('EPSG:4326', crs, always_xy=True)
+    x, y = transformer.transform(metadata[lon_col].values, metadata[lat_col].values)
+
+    return np.column_stack([x, y])
+
+
+def collocate_stations(dt, metadata, k=1, x_dims='x', y_dims='y',
+                       lon_col='x', lat_col='y', max_distance=np.inf):
+    """
+    Maps every station of metadata (get_station_metadata)
+        to its nearest k grid cells of dt.
+    Returns a Dataset of (station, neighbour) y/x indices and
+        distances (in crs units); cells further than
+        max_distance get index -1.
+    """
+
+    load_rioxarray()
+    crs = dt.rio.crs
+    tree = build_grid_index(dt, x_dims, y_dims)
+    points = project_stations(metadata, crs, lon_col, lat_col)
+
+    # nearest k cells of every station at once
+    distance, flat_index = tree.query(points, k=k, distance_upper_bound=max_distance)
+    distance = distance.reshape(len(points), k)
+    flat_index = flat_index.reshape(len(points), k)
+
+    # flat index --> (y, x) index; missing neighbours --> -1
+    found = np.isfinite(distance)
+    iy, ix = np.unravel_index(np.where(found, flat_index, 0), (dt.sizes[y_dims], dt.sizes[x_dims]))
+
+    return xr.Dataset({'iy': (('station', 'neighbour'), np.where(found, iy, -1)),
+                       'ix': (('station', 'neighbour'), np.where(found, ix, -1)),
+                       'distance': (('station', 'neighbour'), distance)},
+                      coords={'station': metadata['station'].values,
+                              'landuse': ('station', metadata['landuse'].values),
+                              'neighbour': np.arange(k)})
+
+
+def extract_station_series(dt, collocation, x_dims='x', y_dims='y', reduce='mean'):
+    """
+    Extracts grid time series of all stations with a single
+        vectorized gather (no per-station .sel loop).
+    reduce: 'mean' averages the k neighbours,
+        None keeps the neighbour dimension
+    """
+
+    found = collocation['iy'] >= 0
+
+    # pointwise indexing: (station, neighbour) gathered at once
+    series = dt.isel({y_dims: collocation['iy'].where(found, 0),
+                      x_dims: collocation['ix'].where(found, 0)})
+    series = series.where(found)
+
+    if reduce == 'mean':
+        series = series.mean(dim='neighbour')
+
+    return series.assign_coords({'landuse': collocation['landuse']})
+
+
+def station_overpass_series(dt, stations, overpass_hour=10.5, datetime_col='Date'):
+    """
+    Daily station series at the satellite overpass hour
+        from an hourly record (adjust_station_data output).
+    A fractional overpass_hour is linearly interpolated
+        between the neighbouring hourly values.
+    Returns a (time, station) DataArray.
+    """
+
+    # (day, hour) x station table
+    hourly = dt.set_index([dt[datetime_col].dt.normalize().rename('time'),
+                           dt[datetime_col].dt.hour.rename('hour')])[list(stations)]
+    hourly = hourly[~hourly.index.duplicated()]
+
+    hour_0 = int(np.floor(overpass_hour))
+    weight = overpass_hour - hour_0
+
+    # values at the neighbouring full hours
+    before = hourly.xs(hour_0, level='hour')
+    if weight == 0:
+        overpass = before
+    else:
+        after = hourly.xs((hour_0 + 1) % 24, level='hour')
+        if hour_0 + 1 >= 24:
+            after.index = after.index - pd.Timedelta(days=1)
+        # days of the record only, the last one lacks the next full hour
+        overpass = before * (1 - weight) + after.reindex(before.index) * weight
+
+    overpass.columns.name = 'station'
+    return xr.DataArray(overpass.astype('float32'), name='obs')
+
+
+def collocate_station_grid(dt, station_dt, metadata, k=1, overpass_hour=10.5,
+                           x_dims='x', y_dims='y', time_dim='time',
+                           lon_col='x', lat_col='y', max_distance=np.inf):
+    """
+    Pairs station records and grid (modis, chirts) series.
+    Returns a Dataset with 'obs' (station) and 'grid' variables
+        on their common daily time axis.
+    """
+
+    collocation = collocate_stations(dt, metadata, k, x_dims, y_dims,
+                                     lon_col, lat_col, max_distance)
+    grid = extract_station_series(dt, collocation, x_dims, y_dims)
+    grid = grid.rename({time_dim: 'time'})
+    grid['time'] = pd.DatetimeIndex(grid['time'].values).normalize()
+
+    obs = station_overpass_series(station_dt, metadata['station'].values, overpass_hour)
+
+    # common days only
+    obs, grid = xr.align(obs, grid.drop_vars('landuse'), join='inner')
+
+    return xr.Dataset({'obs': obs,
+                       'grid': grid.astype('float32')})\
+             .assign_coords({'landuse': collocation['landuse'],
+                             'distance': collocation['distance'].min(dim='neighbour')})
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .utils import define_seasons_from_pd
+
+
+def coverage_path(path):
+    """
+    Returns the path of the coverage index of a store
+        e.g. merged_2011_2018.nc --> merged_2011_2018_coverage.nc
+    """
+
+    root, ext = os.path.splitext(path)
+    return f'{root}_coverage{ext}'
+
+
+def build_coverage_index(dt, out_path=None, time_dim='time', x_dims='x', y_dims='y',
+                         batch=64):
+    """
+    Builds a valid-pixel bitmask per time step
+        (1 bit per pixel, np.packbits) of dt.
+    Data is read in batches of time steps; the
+        index is written to out_path if given.
+    """
+
+    dt = dt.transpose(time_dim, y_dims, x_dims)
+    n_time, n_y, n_x = dt.shape
+
+    # raw (packed) counts mark missing pixels with _FillValue
+    fill_value = None
+    if np.issubdtype(dt.dtype, np.integer):
+        fill_value = dt.attrs.get('_FillValue', dt.encoding.get('_FillValue'))
+
+    packed = np.empty((n_time, (n_y * n_x + 7) // 8), dtype='uint8')
+    for start in range(0, n_time, batch):
+
+        # valid pixels of the current batch --> packed bits
+        values = np.asarray(dt[start:start+batch].values)
+        if np.issubdtype(values.dtype, np.integer):
+            valid = values != fill_value if fill_value is not None else np.ones(values.shape, bool)
+        else:
+            valid = ~np.isnan(values)
+        valid = valid.reshape(values.shape[0], -1)
+        packed[start:start+batch] = np.packbits(valid, axis=-1)
+
+    cov = xr.Dataset({'valid_bits': ((time_dim, 'byte'), packed)},
+                     coords={time_dim: dt[time_dim].values,
+                             y_dims: dt[y_dims].values,
+                             x_dims: dt[x_dims].values})
+    cov = cov.assign_attrs({'data-source': dt.attrs.get('data-source', ''),
+                            'time-dim': time_dim,
+                            'x-dim': x_dims,
+                            'y-dim': y_dims})
+
+    if out_path is not None:
+        cov.to_netcdf(out_path)
+
+    return cov
+
+
+def open_coverage_index(path):
+    return xr.open_dataset(path).load()
+
+
+def _grid_shape(cov):
+    return cov.sizes[cov.attrs['y-dim']], cov.sizes[cov.attrs['x-dim']]
+
+
+def _time_groups(cov, group):
+    """
+    Returns the group label of every time step
+        (None, 'year', 'month' or 'season').
+    """
+
+    time = pd.DatetimeIndex(cov[cov.attrs['time-dim']].values)
+
+    if group is None:
+        return time
+    if group == 'year':
+        return time.year
+    if group == 'month':
+        return time.month
+    if group == 'season':
+        # same seasons as calculate_seasonal_mean
+        return define_seasons_from_pd(pd.DataFrame({'time': time}), 'time').values
+
+    raise ValueError(f'Unknown group: {group}')
+
+
+def iter_valid_mask(cov, batch=64):
+    """
+    Yields (start index, bool array of (batch, y*x))
+        from the packed coverage index.
+    """
+
+    n_y, n_x = _grid_shape(cov)
+    bits = cov['valid_bits'].values
+
+    for start in range(0, bits.shape[0], batch):
+        yield start, np.unpackbits(bits[start:start+batch], axis=-1,
+                                   count=n_y * n_x).astype(bool)
+
+
+def count_valid_per_pixel(cov, group=None, batch=64):
+    """
+    Counts valid observations of every pixel;
+        per year, month or season if group is given.
+    """
+
+    n_y, n_x = _grid_shape(cov)
+    y_dims, x_dims = cov.attrs['y-dim'], cov.attrs['x-dim']
+    coords = {y_dims: cov[y_dims].values, x_dims: cov[x_dims].values}
+
+    if group is None:
+        counts = np.zeros(n_y * n_x, dtype='int32')
+        for _, valid in iter_valid_mask(cov, batch):
+            counts += valid.sum(axis=0)
+
+        return xr.DataArray(counts.reshape(n_y, n_x), dims=(y_dims, x_dims),
+                            coords=coords, name='valid_count')
+
+    # time steps without a group (code -1) are not counted
+    codes, uniques = pd.factorize(_time_groups(cov, group), sort=True)
+
+    counts = np.zeros((len(uniques), n_y * n_x), dtype='int32')
+    for start, valid in iter_valid_mask(cov, batch):
+        batch_codes = codes[start:start+len(valid)]
+        for code in np.unique(batch_codes[batch_codes >= 0]):
+            counts[code] += valid[batch_codes == code].sum(axis=0)
+
+    return xr.DataArray(counts.reshape(-1, n_y, n_x), dims=(group, y_dims, x_dims),
+                        coords={group: np.asarray(uniques), **coords}, name='valid_count')
+
+
+def count_valid_per_class(cov, lu_class, classes=(1, 0), group=None, batch=64):
+    """
+    Counts valid observations of every class of lu_class
+        (e.g. classify_urban_rural output on the same grid)
+        for each time step; summed per year, month or
+        season if group is given.
+    Returns a DataFrame with a column for each class.
+    """
+
+    lu_class = np.asarray(lu_class).reshape(-1)
+
+    # pixel --> class membership matrix
+    membership = np.stack([lu_class == c for c in classes], axis=1).astype('int32')
+
+    counts = np.empty((cov.sizes[cov.attrs['time-dim']], len(classes)), dtype='int64')
+    for start, valid in iter_valid_mask(cov, batch):
+        counts[start:start+len(valid)] = valid.astype('int32') @ membership
+
+    counts = pd.DataFrame(counts, columns=list(classes),
+                          index=pd.DatetimeIndex(cov[cov.attrs['time-dim']].values))
+
+    if group is None:
+        return counts
+
+    return counts.groupby(_time_groups(cov, group), observed=True).sum()
+
+
+def count_pixels_per_class(lu_class, classes=(1, 0)):
+    """
+    Number of pixels of each class, i.e. the possible
+        observations per time step (for valid fractions).
+    """
+
+    lu_class = np.asarray(lu_class)
+    return pd.Series({c: int((lu_class == c).sum()) for c in classes})
@@ -1,20 +1,42 @@
+import os
+from calendar import isleap
+from datetime import datetime
 from glob import glob
 
-import geopandas as gpd
 import numpy as np
 import pandas as pd
-import rioxarray
 import xarray as xr
 
-from .utils import *
-
-
-def clip_subroutine(dt, province, x_dims, y_dims):
+from ._lazy import lazy_import, load_rioxarray
+from .coverage import build_coverage_index, coverage_path, open_coverage_index
+from .rechunk import (find_row_block, open_time_contiguous, parse_bytes,
+                      rechunk_time_contiguous, time_contiguous_path)
+from .utils import (clip_to_city, create_encode_and_decode, define_corine_ghs_date,
+                    define_dmsp_date, define_modis_date, find_modis_tiles,
+                    fix_utf_problems, merge_modis_tiles, prefetch, write_modis_packed)
+
+# heavy geo dependencies are imported on first use
+dask = lazy_import('dask')
+gpd = lazy_import('geopandas')
+rioxarray = lazy_import('rioxarray')
+
+# star-imported by the notebooks: public functions and the
+#     common modules only, never the lazy placeholders
+__all__ = ['read_province_shapefile', 'clip_subroutine', 'find_province_tiles',
+           'retrieve_dmsp', 'retrieve_population', 'retrieve_station',
+           'retrieve_corine', 'find_tile_granules', 'open_modis_tile', 'retrieve_modis',
+           'retrieve_modis_provinces', 'write_modis_provinces', 'retrieve_modis_merged',
+           'write_modis_merged',
+           'retrieve_modis_coverage', 'retrieve_ghs', 'retrieve_chirts',
+           'write_chirts_time_contiguous', 'open_chirts_year', 'iter_chirts_years',
+           'open_modis_granule', 'iter_modis_granules', 'np', 'pd', 'xr', 'glob']
+
+
+def read_province_shapefile():
     """
-    subroutine to clip data to specific province
+    Reads province shapefile with english-character
+        lower case province names (IL column).
     """
-    # projection and coordinate info
-    dt_proj = dt.rio.crs
     
     # open shapefile data
     shapefile_path = r'data/shapefiles/Iller_HGK_6360_Kanun_Sonrasi.shp'
@@ -28,6 +50,21 @@ def clip_subroutine(dt, province, x_dims, y_dims):
         lambda x: fix_utf_problems(x, turkish_encodes, turkish_decodes)
     ).str.lower()
     
+    return shapefile
+
+def clip_subroutine(dt, province, x_dims, y_dims, shapefile=None):
+    """
+    subroutine to clip data to specific province
+    """
+    load_rioxarray()
+    
+    # projection and coordinate info
+    dt_proj = dt.rio.crs
+    
+    # open shapefile data
+    if shapefile is None:
+        shapefile = read_province_shapefile()
+    
     # check province name
     if province not in shapefile['IL'].unique():
         raise 'Inappropriate province name chosen'
@@ -38,6 +75,17 @@ def clip_subroutine(dt, province, x_dims, y_dims):
     # clip data to correspondent province
     clipped_dt = clip_to_city(dt, province_shp, dt_proj, x_dims, y_dims)
     return clipped_dt
+
+def find_province_tiles(province, shapefile=None):
+    """
+    Finds modis sinusoidal tiles (hXXvYY)
+        intersecting corresponding province.
+    """
+    
+    if shapefile is None:
+        shapefile = read_province_shapefile()
+    
+    return find_modis_tiles(shapefile.query(f'IL == "{province}"'))
     
 def retrieve_dmsp(province):
     """
@@ -226,51 +274,71 @@ def retrieve_corine(province):
     return clipped_dt
 
 
-def retrieve_modis(province, source_type):
+def find_tile_granules(il, source_type, tile):
     """
-    Adjusts and retrieves modis dataset
-        of corresponding province.
+    Finds the modis granules of a tile in data/{il}/modis/{source_type};
+        fails naming the tile if none were downloaded.
     """
     
-    tile_dict = {
-        'istanbul': ['h20v04'],
-        'ankara': ['h20v04', 'h20v05'],
-        'izmir': ['h20v04'] # change
-    }
-    tile_extension = tile_dict[province]
-    data_source = 'modis'
-    var_name = 'LST_Day_1km'
-        
-    # loop over tiles
-    tile_dt_list = {}
-    for t_idx, tile in enumerate(tile_extension):
+    data_dir = f'data/{il}/modis/{source_type}'
+    data_links = glob(f'{data_dir}/*{tile}*')
+    if not data_links:
+        raise FileNotFoundError(f'No modis granules of tile {tile} in {data_dir}; '
+                                'download the tile before retrieving the province')
+    
+    return data_links
 
-        # define general path to datasets
-        general_path = f'data/{province}/{data_source}/{source_type}/*{tile}*'
-        #return general_path
-        # get individual data links
-        data_links = glob(general_path)
 
-        # open each data and merge them
-        dt_list = []
+def open_modis_tile(data_links, packed=False):
+    """
+    Opens and merges modis granules of a single tile.
+    """
+    
+    # open each data and merge them
+    dt_list = []
 
-        for link in data_links:
+    for link in data_links:
 
-            # open dataset
-            dt = rioxarray.open_rasterio(link, masked=True, chunks='10mb').squeeze()
+        # open dataset
+        dt = rioxarray.open_rasterio(link, masked=not packed, chunks='10mb').squeeze()
 
-            # assign dates to modis data (the date information is not robust)
-            dt = define_modis_date(dt, link)
+        # assign dates to modis data (the date information is not robust)
+        dt = define_modis_date(dt, link)
 
-            # accumulate each dataset
-            dt_list.append(dt)
+        # accumulate each dataset
+        dt_list.append(dt)
 
-        # merge data
-        merged_dt = xr.concat(dt_list, dim='time')
+    # merge data
+    merged_dt = xr.concat(dt_list, dim='time')
 
-        # multiply data with scale factor
+    # multiply data with scale factor (packed data is decoded lazily)
+    if not packed:
         scale_factor = merged_dt.attrs['scale_factor']
         merged_dt = merged_dt * scale_factor
+    
+    return merged_dt
+
+
+def retrieve_modis(province, source_type, packed=False):
+    """
+    Adjusts and retrieves modis dataset
+        of corresponding province.
+    Tiles are derived from the province geometry.
+    packed: keep raw uint16 counts (scale_factor and _FillValue
+        kept as attributes); decode with decode_modis
+    """
+    
+    shapefile = read_province_shapefile()
+    tile_extension = find_province_tiles(province, shapefile)
+    var_name = 'LST_Day_1km'
+        
+    # loop over tiles
+    tile_dt_list = []
+    for tile in tile_extension:
+
+        # get individual data links
+        data_links = find_tile_granules(province, source_type, tile)
+        merged_dt = open_modis_tile(data_links, packed)
 
         # clip data to province
         x_dims = 'x'
@@ -278,30 +346,138 @@ def retrieve_modis(province, source_type):
         clipped_dt = clip_subroutine(merged_dt, 
                                      province, 
                                      x_dims, 
-                                     y_dims).squeeze()
-        
-        tile_dt_list[tile] = clipped_dt
+                                     y_dims,
+                                     shapefile).squeeze()
         
-    # merging two data together if province is Ankara
-    if province == 'ankara':
-        # y limit where we merge the two dataset together
-        v5_v4_boundary = 120
-        v5_v4_limit = 284
+        tile_dt_list.append(clipped_dt)
         
-        # assign names to dataarrays
-        tile_dt_list[tile_extension[1]].name = var_name
-        tile_dt_list[tile_extension[0]].name = var_name
-                     
-        return xr.merge([tile_dt_list[tile_extension[1]].isel(y=slice(v5_v4_boundary, v5_v4_limit)).squeeze(),
-                         tile_dt_list[tile_extension[0]].isel(y=slice(0, v5_v4_boundary)).squeeze()])
+    # merge tiles of the province together
+    merged_dt = merge_modis_tiles(tile_dt_list)
+    merged_dt.name = var_name
     
-    return tile_dt_list[tile_extension[0]]
+    return merged_dt
 
 
-def retrieve_modis_merged(province, source_type):
+def retrieve_modis_provinces(provinces=None, source_type='terra', packed=False):
+    """
+    Adjusts and retrieves modis dataset of many (None: all)
+        provinces from the common tiles
+        (data/common/modis/{source_type}).
+    Each tile is opened once and shared by every province
+        intersecting it; nothing is computed, write the
+        provinces with write_modis_provinces.
+    Returns a dict of province --> lazy data.
+    """
+    
+    il = 'common'
+    data_source = 'modis'
+    var_name = 'LST_Day_1km'
+    
+    shapefile = read_province_shapefile()
+    if provinces is None:
+        provinces = list(shapefile['IL'].unique())
+    
+    # tile --> provinces intersecting it
+    tile_provinces = {}
+    for province in provinces:
+        for tile in find_province_tiles(province, shapefile):
+            tile_provinces.setdefault(tile, []).append(province)
+    
+    # clips of a tile share its granule reads in the graph
+    province_tiles = {province: [] for province in provinces}
+    for tile, tile_province_list in tile_provinces.items():
+        merged_dt = open_modis_tile(find_tile_granules(il, source_type, tile), packed)
+        for province in tile_province_list:
+            clipped_dt = clip_subroutine(merged_dt, province, 'x', 'y', shapefile).squeeze()
+            province_tiles[province].append(clipped_dt)
+    
+    # merge tiles of each province together
+    province_dt = {}
+    for province, tile_dt_list in province_tiles.items():
+        merged_dt = merge_modis_tiles(tile_dt_list)
+        merged_dt.name = var_name
+        province_dt[province] = merged_dt.assign_attrs({'data-source': data_source,
+                                                        'province': province})
+    
+    return province_dt
+
+
+def write_modis_provinces(provinces=None, source_type='terra', time_contiguous=True,
+                          memory_limit='256MB'):
+    """
+    Writes the merged modis dataset of many (None: all)
+        provinces (see write_modis_merged) from the common tiles.
+    Days are processed in blocks of at most memory_limit for
+        all provinces together: the clips of a block are
+        computed at once, so every granule is read once and
+        no province is held in memory as a whole.
+    Returns a dict of province --> path.
+    """
+    
+    dt_name = 'merged_2011_2018.nc'
+    data_source = 'modis'
+    
+    province_dt = retrieve_modis_provinces(provinces, source_type, packed=True)
+    
+    # common days of all provinces, in blocks fitting memory_limit
+    times = pd.DatetimeIndex([])
+    day_bytes = 0
+    for dt in province_dt.values():
+        times = times.union(dt.indexes['time'])
+        day_bytes += dt.nbytes / max(dt.sizes['time'], 1)
+    block_days = max(int(parse_bytes(memory_limit) // max(day_bytes, 1)), 1)
+    
+    province_paths = {}
+    part_paths = {province: [] for province in province_dt}
+    try:
+        for province in province_dt:
+            general_path = f'data/{province}/{data_source}/{source_type}/{dt_name}'
+            os.makedirs(os.path.dirname(general_path), exist_ok=True)
+            province_paths[province] = general_path
+        
+        for start in range(0, len(times), block_days):
+            block_times = times[start:start+block_days]
+            blocks = {province: dt.sel(time=dt.indexes['time'].intersection(block_times))
+                      for province, dt in province_dt.items()}
+            blocks = dict(zip(blocks, dask.compute(*blocks.values())))
+            
+            for province, block in blocks.items():
+                if block.sizes['time'] == 0:
+                    continue
+                part_path = f'{province_paths[province]}.{start:06d}.part'
+                part_paths[province].append(write_modis_packed(block, part_path))
+        
+        # blocks of each province are copied into its file lazily
+        for province, general_path in province_paths.items():
+            parts = [xr.open_dataarray(part_path, mask_and_scale=False, chunks={})
+                     for part_path in part_paths[province]]
+            try:
+                write_modis_packed(xr.concat(parts, dim='time'), general_path)
+            finally:
+                for part in parts:
+                    part.close()
+    finally:
+        for part_path in sum(part_paths.values(), []):
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    
+    if time_contiguous:
+        # raw counts are copied as they are
+        for general_path in province_paths.values():
+            dt = xr.open_dataset(general_path, mask_and_scale=False)
+            rechunk_time_contiguous(dt, time_contiguous_path(general_path),
+                                    memory_limit=memory_limit)
+    
+    return province_paths
+
+
+def retrieve_modis_merged(province, source_type, layout='spatial', packed=False):
     """
     Retrieves merged modis dataset
         of corresponding province.
+    layout: 'spatial' for map-wise access,
+        'time' for the time-contiguous copy (per-pixel series)
+    packed: keep stored raw counts; decode with decode_modis
     """
     
     dt_name = 'merged_2011_2018.nc'
@@ -316,7 +492,17 @@ def retrieve_modis_merged(province, source_type):
     sample_path = r'data/istanbul/modis/terra/MOD11A1.A2011001.h20v04.006.2016048174242.psrpgscs_000501491268.LST_Day_1km.hdf'
     sample = rioxarray.open_rasterio(sample_path)
     
-    dt = xr.open_dataset(general_path)[var_name]
+    if layout == 'time':
+        dt = open_time_contiguous(time_contiguous_path(general_path),
+                                  mask_and_scale=not packed)[var_name]
+    elif layout == 'spatial':
+        dt = xr.open_dataset(general_path, mask_and_scale=not packed)[var_name]
+    else:
+        raise ValueError(f'Unknown layout: {layout}')
+    
+    # float caches hold decoded values, nothing to keep packed
+    if packed and not np.issubdtype(dt.dtype, np.integer):
+        raise ValueError(f'{general_path} is not packed, rewrite it with write_modis_merged')
     dt = dt.rio.write_crs(sample.rio.crs)
     
     # set dims
@@ -327,6 +513,48 @@ def retrieve_modis_merged(province, source_type):
     # return data
     return dt
 
+def write_modis_merged(province, source_type, time_contiguous=True, memory_limit='256MB'):
+    """
+    Writes the merged modis dataset of corresponding province
+        (read by retrieve_modis_merged) from its granules as
+        CF packed uint16, and its time-contiguous copy.
+    """
+    
+    dt_name = 'merged_2011_2018.nc'
+    data_source = 'modis'
+    
+    # define general path to dataset
+    general_path = f'data/{province}/{data_source}/{source_type}/{dt_name}'
+    
+    write_modis_packed(retrieve_modis(province, source_type, packed=True), general_path)
+    
+    if time_contiguous:
+        # raw counts are copied as they are
+        dt = xr.open_dataset(general_path, mask_and_scale=False)
+        rechunk_time_contiguous(dt, time_contiguous_path(general_path), memory_limit=memory_limit)
+    
+    return general_path
+
+def retrieve_modis_coverage(province, source_type):
+    """
+    Retrieves valid-pixel coverage index of merged
+        modis dataset of corresponding province.
+    The index is built from the data once and cached.
+    """
+    
+    dt_name = 'merged_2011_2018.nc'
+    data_source = 'modis'
+    
+    # define general path to coverage index
+    general_path = coverage_path(f'data/{province}/{data_source}/{source_type}/{dt_name}')
+    
+    if os.path.exists(general_path):
+        return open_coverage_index(general_path)
+    
+    # build the index once from the temperature data
+    dt = retrieve_modis_merged(province, source_type)
+    return build_coverage_index(dt, out_path=general_path)
+
 def retrieve_ghs(province):
     """
     Adjusts and retrieves ghs dataset
@@ -381,4 +609,142 @@ def retrieve_ghs(province):
                                   np.nan)
     
     return clipped_dt
-        
\ No newline at end of file
+        
+
+
+def retrieve_chirts(province, start_year, end_year, var_name='tmax', layout='spatial'):
+    """
+    Adjusts and retrieves chirts dataset
+        of corresponding province (None for the whole domain).
+    layout: 'spatial' for the yearly chirts_{year}.nc files,
+        'time' for the time-contiguous copy (per-pixel series)
+    """
+    
+    # path related to province
+    il = 'common'
+    
+    # data source
+    data_source = 'chirts'
+    
+    # define general path to datasets
+    general_path = f'data/{il}/{data_source}'
+    
+    if layout == 'time':
+        # single time-contiguous file of all years
+        dt = open_time_contiguous(time_contiguous_path(f'{general_path}/chirts_{var_name}.nc'),
+                                  time_dim='T', x_dims='X', y_dims='Y')[var_name]
+        dt = dt.sel(T=slice(str(start_year), str(end_year)))
+        
+    elif layout == 'spatial':
+        dt_list = [open_chirts_year(chirts_year, var_name)
+                   for chirts_year in range(start_year, end_year+1)]
+            
+        # merge datasets
+        dt = xr.concat(dt_list, dim='T')
+        
+    else:
+        raise ValueError(f'Unknown layout: {layout}')
+    
+    # assign data source attribute and crs
+    load_rioxarray()
+    dt = dt.assign_attrs({'data-source': data_source})
+    dt = dt.rio.write_crs(4326)
+    
+    if province is None:
+        return dt
+    
+    # short-cut clip to province
+    dt = dt.assign_attrs({'province': province})
+    return clip_subroutine(dt, province, 'X', 'Y')
+
+
+def write_chirts_time_contiguous(start_year, end_year, var_name='tmax', memory_limit='256MB'):
+    """
+    Writes the time-contiguous copy of the yearly chirts
+        files (read by retrieve_chirts with layout='time')
+        with decoded daily dates.
+    """
+    
+    # path related to province
+    il = 'common'
+    
+    # data source
+    data_source = 'chirts'
+    
+    # define general path to datasets
+    general_path = f'data/{il}/{data_source}'
+    
+    # yearly files are read in the row blocks of the copy,
+    #     never as a whole
+    years = range(start_year, end_year+1)
+    sample = open_chirts_year(start_year, var_name)
+    n_time = sum(366 if isleap(chirts_year) else 365 for chirts_year in years)
+    block_y = find_row_block(n_time, sample.sizes['Y'], sample.sizes['X'],
+                             sample.dtype.itemsize, memory_limit)
+    sample.close()
+    
+    dt = xr.concat([open_chirts_year(chirts_year, var_name, chunks={'T': -1, 'Y': block_y})
+                    for chirts_year in years], dim='T')
+    
+    return rechunk_time_contiguous(dt.to_dataset(name=var_name),
+                                   time_contiguous_path(f'{general_path}/chirts_{var_name}.nc'),
+                                   time_dim='T', x_dims='X', y_dims='Y',
+                                   memory_limit=memory_limit)
+
+def open_chirts_year(chirts_year, var_name='tmax', chunks=None):
+    """
+    Opens yearly chirts file with daily dates.
+    chunks: dask chunks (default: lazily indexed, no dask)
+    """
+    
+    dt = xr.open_dataset(f'data/common/chirts/chirts_{chirts_year}.nc', chunks=chunks)[var_name]
+    
+    # assign daily dates (time information is not decoded)
+    dt['T'] = pd.date_range(datetime(chirts_year, 1, 1),
+                            datetime(chirts_year, 12, 31),
+                            freq='1d')
+    return dt
+
+
+def iter_chirts_years(start_year, end_year, var_name='tmax', ahead=2,
+                      max_workers=2, memory_limit='2GB'):
+    """
+    Yields (year, loaded yearly chirts data) while the
+        next years are read in the background.
+    """
+    
+    def load(chirts_year):
+        load_rioxarray()
+        dt = open_chirts_year(chirts_year, var_name).load()
+        return dt.rio.write_crs(4326)
+    
+    yield from prefetch(range(start_year, end_year+1), load, ahead=ahead,
+                        max_workers=max_workers, memory_limit=parse_bytes(memory_limit))
+
+
+def open_modis_granule(link, packed=False):
+    """
+    Opens a single modis granule with its date.
+    """
+    
+    dt = rioxarray.open_rasterio(link, masked=not packed).squeeze()
+    
+    # assign dates to modis data (the date information is not robust)
+    return define_modis_date(dt, link)
+
+
+def iter_modis_granules(province, source_type, tile, ahead=4, max_workers=2,
+                        memory_limit='1GB', packed=False):
+    """
+    Yields (link, loaded modis granule) of a tile while
+        the next granules are read in the background.
+    """
+    
+    # a missing tile fails instead of yielding nothing
+    data_links = sorted(find_tile_granules(province, source_type, tile))
+    
+    def load(link):
+        return open_modis_granule(link, packed).load()
+    
+    yield from prefetch(data_links, load, ahead=ahead,
+                        max_workers=max_workers, memory_limit=parse_bytes(memory_limit))
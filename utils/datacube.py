@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+from .data import (read_province_shapefile, retrieve_chirts, retrieve_corine, retrieve_dmsp,
+                   retrieve_ghs, retrieve_modis_merged)
+from .download import atomic_to_netcdf
+from .utils import classify_urban_rural
+
+enums = lazy_import('rasterio.enums')
+
+# variable --> (retriever, resampling, daily)
+# daily variables share the 'time' axis, the others keep
+#     their own epochs on '{variable}_time'
+DATACUBE_SOURCES = {
+    'lst_terra': (lambda province, start_year, end_year:
+                  retrieve_modis_merged(province, 'terra'), 'bilinear', True),
+    'lst_aqua': (lambda province, start_year, end_year:
+                 retrieve_modis_merged(province, 'aqua'), 'bilinear', True),
+    'tmax': (lambda province, start_year, end_year:
+             retrieve_chirts(province, start_year, end_year, 'tmax'), 'bilinear', True),
+    'tmin': (lambda province, start_year, end_year:
+             retrieve_chirts(province, start_year, end_year, 'tmin'), 'bilinear', True),
+    'ghs': (lambda province, start_year, end_year:
+            retrieve_ghs(province), 'mode', False),
+    'corine': (lambda province, start_year, end_year:
+               retrieve_corine(province), 'mode', False),
+    'dmsp': (lambda province, start_year, end_year:
+             retrieve_dmsp(province), 'bilinear', False),
+}
+
+
+def _datacube_config(grid, variables, urban_classes, rural_classes, landuse_source):
+    """
+    Everything besides province and years that changes the
+        content of the cube, as a json string.
+    """
+
+    def _sorted(values):
+        return None if values is None else sorted(np.asarray(values).tolist())
+
+    return json.dumps({'grid': grid,
+                       'variables': sorted(DATACUBE_SOURCES if variables is None else variables),
+                       'urban_classes': _sorted(urban_classes),
+                       'rural_classes': _sorted(rural_classes),
+                       'landuse_source': landuse_source}, sort_keys=True)
+
+
+def datacube_path(province, grid, start_year, end_year, variables=None,
+                  urban_classes=None, rural_classes=None, landuse_source='corine'):
+    """
+    Cache path of a datacube; cubes of other variables or
+        urban/rural classes get their own file.
+    """
+
+    config = _datacube_config(grid, variables, urban_classes, rural_classes, landuse_source)
+    key = hashlib.sha1(config.encode()).hexdigest()[:10]
+
+    return f'data/{province}/datacube/datacube_{grid}_{start_year}_{end_year}_{key}.nc'
+
+
+def _check_chirts_years(start_year, end_year):
+    """
+    Fails before any retrieval if a yearly chirts file
+        of the period has not been downloaded.
+    """
+
+    missing = [year for year in range(start_year, end_year+1)
+               if not os.path.exists(f'data/common/chirts/chirts_{year}.nc')]
+    if missing:
+        raise FileNotFoundError(f'No chirts data for {missing} in data/common/chirts; '
+                                'download it with download_chirts or choose another period')
+
+
+def _standardize_dims(dt, variable, daily):
+    """
+    Renames chirts dims (T, X, Y) to time, x, y and the
+        epoch axis of non-daily sources to {variable}_time.
+    """
+
+    dt = dt.squeeze(drop=True)
+    chirts_dims = {'T': 'time', 'X': 'x', 'Y': 'y'}
+    dt = dt.rename({dim: name for dim, name in chirts_dims.items() if dim in dt.dims})
+    if 'time' in dt.dims and not daily:
+        dt = dt.rename({'time': f'{variable}_time'})
+
+    # daily sources are matched by calendar day
+    if 'time' in dt.dims:
+        dt = dt.assign_coords({'time': dt.indexes['time'].normalize()}).sortby('time')
+
+    return dt.rio.set_spatial_dims(x_dim='x', y_dim='y')
+
+
+def _province_mask(template, province):
+    """
+    Pixels of the target grid inside the province
+        (same touching rule as clip_subroutine, no cropping).
+    """
+
+    shapefile = read_province_shapefile()
+    if province not in shapefile['IL'].unique():
+        raise ValueError(f'Unknown province: {province}')
+    province_shp = shapefile.query(f'IL == "{province}"')
+
+    ones = xr.ones_like(template, dtype='float32').rio.write_crs(template.rio.crs)
+    inside = ones.rio.clip(province_shp.geometry.values, province_shp.crs,
+                           all_touched=True, drop=False)
+
+    return inside.notnull().rename('province_mask')
+
+
+def build_datacube(province, grid='lst_terra', variables=None, start_year=2011, end_year=2015,
+                   urban_classes=None, rural_classes=None, landuse_source='corine'):
+    """
+    Retrieves every source of the province, reprojects it
+        once onto the grid of the variable grid and merges
+        all of them into a single dataset.
+    Daily variables are limited to start_year - end_year
+        (default: the years covered by both modis and the
+        default download_chirts period).
+    Values outside the province are masked on every variable
+        (province_mask); lu_class (1 urban, 0 rural) of the
+        last landuse_source epoch is added if urban_classes
+        and rural_classes are given.
+    """
+
+    load_rioxarray()
+    variables = list(DATACUBE_SOURCES) if variables is None else list(variables)
+    if grid not in variables:
+        raise ValueError(f'grid must be one of the variables: {variables}')
+
+    classify = urban_classes is not None and rural_classes is not None
+    if classify and landuse_source not in variables:
+        raise ValueError(f'{landuse_source} is needed for lu_class, add it to the variables')
+
+    if 'tmax' in variables or 'tmin' in variables:
+        _check_chirts_years(start_year, end_year)
+
+    # target grid is retrieved first
+    variables.remove(grid)
+    variables.insert(0, grid)
+
+    cube = {}
+    for variable in variables:
+        retrieve_func, resampling, daily = DATACUBE_SOURCES[variable]
+        dt = _standardize_dims(retrieve_func(province, start_year, end_year), variable, daily)
+        if daily:
+            dt = dt.sel(time=slice(str(start_year), str(end_year)))
+
+        if variable == grid:
+            template = dt.isel({dim: 0 for dim in dt.dims if dim not in ('x', 'y')})
+            province_mask = _province_mask(template, province)
+        else:
+            dt = dt.rio.reproject_match(template, resampling=getattr(enums.Resampling, resampling))
+
+        dt = dt.drop_vars([coord for coord in ('band', 'spatial_ref') if coord in dt.coords])
+        dt = dt.transpose(..., 'y', 'x').assign_coords({'x': template['x'].values,
+                                                        'y': template['y'].values})
+        cube[variable] = dt.astype('float32').where(province_mask.values)
+
+    cube = xr.Dataset(cube)
+    cube['province_mask'] = (('y', 'x'), province_mask.values)
+
+    if classify:
+        landuse = cube[landuse_source].isel({f'{landuse_source}_time': -1})
+        cube['lu_class'] = classify_urban_rural(landuse, urban_classes, rural_classes)
+
+    # one crs for all variables
+    cube = cube.rio.write_crs(template.rio.crs)
+
+    config = _datacube_config(grid, variables, urban_classes, rural_classes, landuse_source)
+    return cube.assign_attrs({'province': province,
+                              'grid': grid,
+                              'start-year': start_year,
+                              'end-year': end_year,
+                              'datacube-config': config})
+
+
+def retrieve_datacube(province, grid='lst_terra', variables=None, start_year=2011, end_year=2015,
+                      urban_classes=None, rural_classes=None, landuse_source='corine',
+                      chunks=None, overwrite=False):
+    """
+    Retrieves the analysis-ready datacube of the province;
+        it is built with build_datacube and cached once
+        per variables / urban-rural classes.
+    chunks: dask chunks of the opened cube
+        (default: one year of days, full space)
+    """
+
+    general_path = datacube_path(province, grid, start_year, end_year, variables,
+                                 urban_classes, rural_classes, landuse_source)
+
+    if overwrite or not os.path.exists(general_path):
+        cube = build_datacube(province, grid, variables, start_year, end_year,
+                              urban_classes, rural_classes, landuse_source)
+        os.makedirs(os.path.dirname(general_path), exist_ok=True)
+        atomic_to_netcdf(cube, general_path)
+
+    chunks = {'time': 366} if chunks is None else chunks
+    cube = xr.open_dataset(general_path)
+
+    return cube.chunk({dim: size for dim, size in chunks.items() if dim in cube.dims})
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .utils import define_seasons_from_pd
+
+SEASON_ORDER = ['DJF', 'MAM', 'JJA', 'SON']
+
+# calendar of the 366 day-of-year slots (leap year)
+SLOT_DATES = pd.date_range('2000-01-01', '2000-12-31', freq='1D')
+
+
+def _day_slots(dates):
+    """
+    Day-of-year slot (0-365) of dates; non-leap years skip
+        the 29 February slot so a slot is always the same
+        calendar day.
+    """
+
+    dates = pd.DatetimeIndex(dates)
+    slot = dates.dayofyear.values - 1
+    after_feb = ~dates.is_leap_year & (dates.month > 2)
+
+    return slot + after_feb
+
+
+def _slot_seasons(years):
+    """
+    Season (define_seasons_from_pd) of every (year, day)
+        slot; the boundaries move by a day in leap years
+        and 29 February of other years has no season.
+    """
+
+    seasons = np.full((len(years), 366), None, dtype=object)
+    for i, year in enumerate(years):
+        dates = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='1D')
+        year_seasons = define_seasons_from_pd(pd.DataFrame({'Date': dates}), 'Date')
+        seasons[i, _day_slots(dates)] = year_seasons.astype(object).where(year_seasons.notnull(), None)
+
+    return seasons
+
+
+def build_station_cube(dt, metadata, datetime_col='Date'):
+    """
+    Reshapes hourly station records (adjust_station_data
+        output) into a padded (station, year, day, hour)
+        float32 array; missing hours are nan.
+    The record is scattered once into the padded array.
+    metadata: get_station_metadata output (station, landuse)
+    """
+
+    stations = list(metadata['station'])
+    dates = pd.DatetimeIndex(dt[datetime_col])
+    years = np.arange(dates.year.min(), dates.year.max() + 1)
+
+    # position of every record in the cube
+    year_idx = dates.year.values - years[0]
+    day_idx = _day_slots(dates)
+    hour_idx = dates.hour.values
+
+    cube = np.full((len(stations), len(years), 366, 24), np.nan, dtype='float32')
+    cube[:, year_idx, day_idx, hour_idx] = dt[stations].to_numpy(dtype='float32').T
+
+    return xr.DataArray(cube, dims=('station', 'year', 'day', 'hour'),
+                        coords={'station': stations,
+                                'landuse': ('station', metadata['landuse'].values),
+                                'year': years,
+                                'day': np.arange(366),
+                                'month': ('day', SLOT_DATES.month),
+                                'season': (('year', 'day'), _slot_seasons(years)),
+                                'hour': np.arange(24)},
+                        name='T')
+
+
+def missing_mask(cube):
+    """
+    True where a station hour is missing (or padding).
+    """
+
+    return np.isnan(cube)
+
+
+def diurnal_composite(cube, by='month'):
+    """
+    Mean diurnal cycle of every station per month,
+        season (or None for the whole record).
+    Years and days are reduced together with one
+        weighted sum over the (year, day) axes.
+    Returns a (station, group, hour) DataArray.
+    """
+
+    values = cube.values
+    valid = ~np.isnan(values)
+
+    # group of every (year, day) slot; -1 for no group
+    if by is None:
+        codes = np.zeros((cube.sizes['year'], cube.sizes['day']), dtype=int)
+        groups = ['all']
+    else:
+        labels = cube[by].broadcast_like(cube['year']).transpose('year', 'day').values.ravel()
+        if by == 'season':
+            labels = pd.Categorical(labels, categories=SEASON_ORDER)
+        codes, groups = pd.factorize(labels, sort=True)
+        codes = codes.reshape(cube.sizes['year'], cube.sizes['day'])
+        groups = np.asarray(groups)
+
+    # (year, day) --> group membership
+    membership = (codes[..., None] == np.arange(len(groups))).astype('float32')
+
+    group_sums = np.einsum('sydh,ydg->sgh', np.where(valid, values, 0), membership, optimize=True)
+    group_counts = np.einsum('sydh,ydg->sgh', valid.astype('float32'), membership, optimize=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        composite = group_sums / group_counts
+
+    group_dim = by if by is not None else 'group'
+    return xr.DataArray(composite.astype('float32'),
+                        dims=('station', group_dim, 'hour'),
+                        coords={'station': cube['station'].values,
+                                'landuse': ('station', cube['landuse'].values),
+                                group_dim: groups,
+                                'hour': cube['hour'].values})
+
+
+def landuse_composite(composite):
+    """
+    Averages station composites of each land use group.
+    """
+
+    return composite.groupby('landuse').mean(dim='station')
+
+
+def day_night_uhi(cube, by='month', urban='urban', rural='nourban',
+                  day_hours=range(9, 18), night_hours=(21, 22, 23, 0, 1, 2, 3, 4, 5)):
+    """
+    Daytime and nighttime UHI (urban minus rural land use
+        group mean) per month, season or whole record.
+    Returns a (group, period) DataArray.
+    """
+
+    composite = landuse_composite(diurnal_composite(cube, by))
+    uhi = composite.sel(landuse=urban) - composite.sel(landuse=rural)
+
+    return xr.concat([uhi.sel(hour=list(day_hours)).mean(dim='hour'),
+                      uhi.sel(hour=list(night_hours)).mean(dim='hour')],
+                     dim=pd.Index(['day', 'night'], name='period')).transpose(..., 'period')
@@ -0,0 +1,249 @@
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from calendar import isleap
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import xarray as xr
+
+
+# IRI data library entry point of the CHIRTS daily 0.05 degree product
+CHIRTS_BASE_URL = r'http://iridl.ldeo.columbia.edu/SOURCES/.UCSB/.CHIRTS/.v1.0/.daily/.global/.0p05'
+
+# name of the checkpoint file kept next to the downloaded data
+CHECKPOINT_NAME = 'chirts_checkpoint.json'
+
+# hdf5 is not thread safe: local netcdf reads and writes of the
+#     download threads are serialized, the transfers are not
+NETCDF_LOCK = threading.Lock()
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _ingrid_date(date_tuple):
+
+    # IRI ingrid date --> (1 Jan 1990) url-encoded
+    year, month, day = date_tuple
+    return f'%28{day}%20{MONTHS[month-1]}%20{year}%29'
+
+
+def build_chirts_url(var_name, year, lats=(36, 42), lons=(26, 45),
+                     base_url=CHIRTS_BASE_URL, file_type='data.nc'):
+    """
+    Builds the url of a single variable-year CHIRTS subset
+        (same constraints as chirts_data_retrieve).
+    file_type: 'data.nc' for a netcdf file download,
+        'dods' for the OPeNDAP endpoint
+    """
+
+    # spatial constraints
+    y_range = f'Y/%28{lats[0]}N%29%28{lats[1]}N%29RANGEEDGES'
+    x_range = f'X/%28{lons[0]}E%29%28{lons[1]}E%29RANGEEDGES'
+
+    # temporal constraint: one full year
+    t_range = f'T/{_ingrid_date((year, 1, 1))}{_ingrid_date((year, 12, 31))}RANGEEDGES'
+
+    return f'{base_url}/.{var_name}/{y_range}/{x_range}/{t_range}/{file_type}'
+
+
+def split_chirts_requests(var_names, start_year, end_year):
+    """
+    Splits the whole CHIRTS request into
+        variable and year sized subsets.
+    """
+
+    return [(var_name, year)
+            for year in range(start_year, end_year+1)
+            for var_name in var_names]
+
+
+def chirts_part_path(out_dir, var_name, year):
+    return os.path.join(out_dir, f'chirts_{var_name}_{year}.nc')
+
+
+def chirts_year_path(out_dir, year):
+    return os.path.join(out_dir, f'chirts_{year}.nc')
+
+
+def atomic_to_netcdf(dt, path):
+    """
+    Writes dataset to a temporary file and moves it
+        onto the final path, so that a half written
+        file never appears under the final name.
+    """
+
+    tmp_path = f'{path}.part'
+    try:
+        dt.to_netcdf(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return path
+
+
+def verify_chirts_subset(dt, var_name, year, time_dim='T'):
+    """
+    Checks a downloaded variable-year subset;
+        raises ValueError if it is not complete.
+    """
+
+    if var_name not in dt.data_vars:
+        raise ValueError(f'{var_name} is missing in CHIRTS subset of {year}')
+
+    # a full year of daily data is expected
+    n_days = 366 if isleap(year) else 365
+    if dt.sizes.get(time_dim) != n_days:
+        raise ValueError(f'CHIRTS {var_name} {year} has {dt.sizes.get(time_dim)} '
+                         f'time steps, {n_days} expected')
+
+    # a subset without any valid value points to a failed transfer
+    if int(dt[var_name].count()) == 0:
+        raise ValueError(f'CHIRTS {var_name} {year} contains no valid data')
+
+    return dt
+
+
+def load_checkpoint(out_dir):
+    """
+    Returns the set of (var_name, year) subsets
+        already completed in out_dir.
+    """
+
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return set()
+
+    with open(path) as f:
+        done = json.load(f)
+
+    # completed subsets only count if their file is still there
+    return {(var_name, year) for var_name, year in done
+            if os.path.exists(chirts_part_path(out_dir, var_name, year))}
+
+
+def save_checkpoint(out_dir, done):
+
+    path = os.path.join(out_dir, CHECKPOINT_NAME)
+    tmp_path = f'{path}.part'
+
+    with open(tmp_path, 'w') as f:
+        json.dump(sorted([list(d) for d in done]), f)
+    os.replace(tmp_path, path)
+
+
+def download_chirts_subset(var_name, year, out_dir, lats=(36, 42), lons=(26, 45),
+                           base_url=CHIRTS_BASE_URL, retries=3, backoff=5, timeout=300):
+    """
+    Downloads, verifies and atomically writes
+        a single variable-year CHIRTS subset.
+    The subset is transferred as a plain netcdf file over
+        http: remote (OPeNDAP) reads of xarray hold a process
+        wide netcdf lock, which would serialize the threads
+        of download_chirts.
+    """
+
+    url = build_chirts_url(var_name, year, lats, lons, base_url)
+    path = chirts_part_path(out_dir, var_name, year)
+    download_path = f'{path}.download'
+
+    for attempt in range(retries):
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response, \
+                    open(download_path, 'wb') as f:
+                shutil.copyfileobj(response, f)
+
+            with NETCDF_LOCK:
+                with xr.open_dataset(download_path, decode_times=False) as dt:
+                    dt = dt[[var_name]].load()
+
+                verify_chirts_subset(dt, var_name, year)
+                return atomic_to_netcdf(dt, path)
+
+        except (OSError, RuntimeError, ValueError):
+            if attempt == retries-1:
+                raise
+
+            # wait a bit longer after each failure
+            time.sleep(backoff * 2**attempt)
+
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+
+
+def merge_chirts_year(out_dir, var_names, year):
+    """
+    Merges variable subsets of a year into
+        chirts_{year}.nc used by the analyses.
+    """
+
+    parts = [xr.open_dataset(chirts_part_path(out_dir, var_name, year), decode_times=False)
+             for var_name in var_names]
+    try:
+        merged_dt = xr.merge(parts).load()
+    finally:
+        for part in parts:
+            part.close()
+
+    return atomic_to_netcdf(merged_dt, chirts_year_path(out_dir, year))
+
+
+def download_chirts(var_names=('tmax', 'tmin'), start_year=1990, end_year=2015,
+                    out_dir='data/common/chirts', lats=(36, 42), lons=(26, 45),
+                    base_url=CHIRTS_BASE_URL, max_workers=4, retries=3, backoff=5,
+                    timeout=300):
+    """
+    Concurrently downloads CHIRTS in variable-year subsets,
+        resumes from the checkpoint of out_dir and writes
+        per-year chirts_{year}.nc files.
+    Returns the list of written per-year files.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # skip what has already been downloaded
+    done = load_checkpoint(out_dir)
+    todo = [r for r in split_chirts_requests(var_names, start_year, end_year)
+            if r not in done]
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download_chirts_subset, var_name, year, out_dir,
+                                   lats, lons, base_url, retries, backoff, timeout): (var_name, year)
+                   for var_name, year in todo}
+
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors[key] = e
+                continue
+
+            # record progress after every completed subset
+            done.add(key)
+            save_checkpoint(out_dir, done)
+
+    # build per-year files of the years whose subsets are all present
+    year_paths = []
+    for year in range(start_year, end_year+1):
+        if not all((var_name, year) in done for var_name in var_names):
+            continue
+
+        year_path = chirts_year_path(out_dir, year)
+        if any((var_name, year) in todo for var_name in var_names) or not os.path.exists(year_path):
+            year_path = merge_chirts_year(out_dir, var_names, year)
+        year_paths.append(year_path)
+
+    if errors:
+        failed = ', '.join(f'{v}-{y}' for v, y in sorted(errors))
+        raise RuntimeError(f'CHIRTS subsets failed: {failed}; '
+                           f'rerun download_chirts to resume') from next(iter(errors.values()))
+
+    return year_paths
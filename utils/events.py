@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def _run_statistics(exceed, year_idx, n_years, min_duration):
+    """
+    Run-length statistics of exceedance (bool) along the
+        last axis, each run assigned to the year (year_idx
+        of every step) it starts in: number of runs of at
+        least min_duration, longest run and days within
+        such runs per year.
+    """
+
+    exceed = np.asarray(exceed, dtype=bool)
+    shape = exceed.shape[:-1]
+    exceed = exceed.reshape(-1, exceed.shape[-1])
+    count = np.cumsum(exceed, axis=-1, dtype='int32')
+
+    # running length of the current run (0 outside runs)
+    reset = np.maximum.accumulate(np.where(exceed, 0, count), axis=-1)
+    run_length = count - reset
+
+    # a run ends where the next day is not exceeding
+    next_exceed = np.concatenate([exceed[:, 1:],
+                                  np.zeros((exceed.shape[0], 1), dtype=bool)], axis=-1)
+    pixel, end = np.nonzero(exceed & ~next_exceed)
+    length = run_length[pixel, end]
+
+    # (pixel, year of the first day) of every run
+    key = pixel * n_years + year_idx[end - length + 1]
+    event = length >= min_duration
+
+    n_keys = exceed.shape[0] * n_years
+    event_count = np.bincount(key[event], minlength=n_keys)
+    event_days = np.bincount(key[event], weights=length[event], minlength=n_keys)
+    max_duration = np.zeros(n_keys, dtype='int32')
+    np.maximum.at(max_duration, key, length)
+
+    return tuple(values.reshape(shape + (n_years,)).astype('int32')
+                 for values in (event_count, max_duration, event_days))
+
+
+def detect_heatwaves(dt, min_duration=3, threshold=None, percentile=None,
+                     time_dim='time', base_period=None):
+    """
+    Detects runs of at least min_duration consecutive days
+        above threshold (or above the per-pixel/station
+        percentile of base_period) on every pixel or
+        station at once.
+    Returns yearly event counts, maximum durations
+        and total heatwave days; a run spanning the new
+        year counts (with all of its days) in the year
+        it starts in.
+    Dask data is processed with the full time series of
+        every chunk of pixels (e.g. the time-contiguous
+        layout), so runs are never cut at chunk boundaries.
+    """
+
+    if (threshold is None) == (percentile is None):
+        raise ValueError('Give either threshold or percentile')
+
+    if percentile is not None:
+        base = dt if base_period is None else dt.sel({time_dim: slice(*base_period)})
+        threshold = base.chunk({time_dim: -1}) if base.chunks is not None else base
+        threshold = threshold.quantile(percentile / 100, dim=time_dim).drop_vars('quantile')
+
+    # nan is not an exceedance
+    exceed = dt > threshold
+    if exceed.chunks is not None:
+        exceed = exceed.chunk({time_dim: -1})
+
+    year_idx, years = pd.factorize(exceed[time_dim].dt.year.values, sort=True)
+
+    event_count, max_duration, event_days = xr.apply_ufunc(
+        _run_statistics, exceed,
+        kwargs={'year_idx': year_idx, 'n_years': len(years), 'min_duration': min_duration},
+        input_core_dims=[[time_dim]], output_core_dims=[['year'], ['year'], ['year']],
+        dask='parallelized', output_dtypes=['int32', 'int32', 'int32'],
+        dask_gufunc_kwargs={'output_sizes': {'year': len(years)}})
+
+    events = xr.Dataset({'event_count': event_count,
+                         'max_duration': max_duration,
+                         'heatwave_days': event_days}).assign_coords({'year': years})
+    events = events.transpose('year', ...)
+
+    # per-pixel thresholds do not fit into attributes
+    if percentile is not None:
+        threshold_attr = 'percentile'
+    elif np.ndim(threshold) == 0:
+        threshold_attr = float(threshold)
+    else:
+        threshold_attr = 'per-pixel'
+
+    return events.assign_attrs({'min-duration': min_duration,
+                                'threshold': threshold_attr,
+                                'percentile': percentile if percentile is not None else 'none'})
+
+
+def heatwaves_per_class(events, classes, how='mean'):
+    """
+    Aggregates detect_heatwaves output per class and year.
+    classes: DataArray of class labels on the same grid /
+        stations (e.g. classify_urban_rural output or
+        station land use)
+    """
+
+    grouped = events.groupby(classes.rename('class'))
+    if how == 'mean':
+        return grouped.mean()
+    if how == 'median':
+        return grouped.median()
+
+    raise ValueError(f'Unknown aggregation: {how}')
+
+
+def station_daily_max(dt, stations, datetime_col='Date'):
+    """
+    Daily maximum of hourly station records
+        (adjust_station_data output) as a
+        (time, station) DataArray.
+    """
+
+    daily = dt.set_index(datetime_col)[list(stations)].astype('float64').resample('1D').max()
+    daily.index.name = 'time'
+    daily.columns.name = 'station'
+
+    return xr.DataArray(daily)
@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .data import retrieve_modis_merged
+
+# per-pixel source flags of the fused cube
+SOURCE_FLAGS = {'missing': 0,
+                'terra': 1,
+                'aqua': 2,
+                'filled': 3}
+
+
+def _daily_index(dt, time_dim):
+    return pd.DatetimeIndex(dt.indexes[time_dim]).normalize()
+
+
+def _read_days(dt, positions, time_dim):
+    """
+    Reads the days at positions (-1 for days the sensor
+        does not have) as a float32 array.
+    """
+
+    values = np.full((len(positions),) + dt.shape[1:], np.nan, dtype='float32')
+    available = positions >= 0
+    if available.any():
+        values[available] = dt.isel({time_dim: positions[available]}).values
+
+    return values
+
+
+def fill_gaps_linear(values, flags=None, max_gap=None, pixel_batch=4096):
+    """
+    Linearly interpolates nan gaps of a (time, ...) array
+        along time in place; gaps longer than max_gap
+        steps and gaps at the edges are left as nan.
+    Works on batches of pixels, so the helper index arrays
+        never span the full cube.
+    flags (same shape) is set to SOURCE_FLAGS['filled']
+        where values were filled.
+    """
+
+    n_time = values.shape[0]
+    values_2d = values.reshape(n_time, -1)
+    flags_2d = flags.reshape(n_time, -1) if flags is not None else None
+    steps = np.arange(n_time, dtype='int32')[:, None]
+
+    for start in range(0, values_2d.shape[1], pixel_batch):
+        block = values_2d[:, start:start+pixel_batch]
+        missing = np.isnan(block)
+        if not missing.any():
+            continue
+
+        # last valid step before and first valid step after every step
+        previous = np.maximum.accumulate(np.where(missing, -1, steps), axis=0)
+        following = np.minimum.accumulate(np.where(missing, n_time, steps)[::-1], axis=0)[::-1]
+
+        fillable = missing & (previous >= 0) & (following < n_time)
+        if max_gap is not None:
+            fillable &= (following - previous - 1) <= max_gap
+        if not fillable.any():
+            continue
+
+        time_idx, pixel_idx = np.nonzero(fillable)
+        before = previous[time_idx, pixel_idx]
+        after = following[time_idx, pixel_idx]
+        weight = (time_idx - before) / (after - before)
+
+        block[time_idx, pixel_idx] = (block[before, pixel_idx] * (1 - weight)
+                                      + block[after, pixel_idx] * weight)
+        if flags_2d is not None:
+            flags_2d[:, start:start+pixel_batch][time_idx, pixel_idx] = SOURCE_FLAGS['filled']
+
+    return values
+
+
+def _time_contiguous_rows(dt, time_dim):
+    """
+    Rows of a dask chunk if dt is chunked time-contiguous
+        (full time axis per chunk), otherwise None.
+    """
+
+    if dt.chunks is None or len(dt.chunks[dt.get_axis_num(time_dim)]) > 1:
+        return None
+
+    return max(dt.chunks[1])
+
+
+def _fuse_days(terra_values, aqua_values, groups, n_groups):
+    """
+    Fuses read days in place of terra_values (aqua where
+        terra is missing); returns source flags and the
+        per-group sums and counts of terra-aqua differences.
+    """
+
+    terra_valid = ~np.isnan(terra_values)
+    aqua_valid = ~np.isnan(aqua_values)
+    both = terra_valid & aqua_valid
+
+    bias_sums = np.zeros((n_groups,) + terra_values.shape[1:])
+    bias_counts = np.zeros((n_groups,) + terra_values.shape[1:], dtype='int64')
+    for group in np.unique(groups):
+        in_group = groups == group
+        bias_sums[group] = np.where(both[in_group],
+                                    terra_values[in_group] - aqua_values[in_group], 0).sum(axis=0)
+        bias_counts[group] = both[in_group].sum(axis=0)
+
+    # aqua only fills days terra misses
+    use_aqua = ~terra_valid & aqua_valid
+    np.copyto(terra_values, aqua_values, where=use_aqua)
+    source = np.zeros(terra_values.shape, dtype='uint8')
+    source[terra_valid] = SOURCE_FLAGS['terra']
+    source[use_aqua] = SOURCE_FLAGS['aqua']
+
+    return source, bias_sums, bias_counts
+
+
+def _shift_aqua(fused, source, bias, groups, batch):
+    # days of the same group are shifted together
+    for group in range(len(bias)):
+        day_idx = np.nonzero(groups == group)[0]
+        for start in range(0, len(day_idx), batch):
+            chunk = day_idx[start:start+batch]
+            shifted = fused[chunk] + np.nan_to_num(bias[group])
+            use_aqua = source[chunk] == SOURCE_FLAGS['aqua']
+            fused[chunk] = np.where(use_aqua, shifted, fused[chunk])
+
+
+def fuse_terra_aqua(terra, aqua, time_dim='time', bias_correction='monthly',
+                    max_gap=None, batch=64):
+    """
+    Fuses terra and aqua LST on a common daily axis in one
+        pass over both sensors: terra where valid, aqua
+        (shifted by the terra-aqua overpass bias) where
+        terra is missing, then optional linear gap filling.
+    bias_correction: None, 'mean' (per pixel) or 'monthly'
+        (per pixel and calendar month); estimated from days
+        both sensors are valid.
+    max_gap: longest gap (days) filled along time;
+        None for no gap filling.
+    Map-wise inputs are read batch days at a time;
+        time-contiguous ones (a single dask chunk along
+        time) a row of chunks at a time, so that every
+        stored chunk is read once.
+    Returns LST, source (SOURCE_FLAGS) and overpass_bias.
+    """
+
+    if terra.shape[1:] != aqua.shape[1:]:
+        raise ValueError('terra and aqua must be on the same grid')
+
+    terra_days = _daily_index(terra, time_dim)
+    aqua_days = _daily_index(aqua, time_dim)
+    days = terra_days.union(aqua_days)
+    terra_positions = terra_days.get_indexer(days)
+    aqua_positions = aqua_days.get_indexer(days)
+
+    # bias groups: 0 for 'mean', month-1 for 'monthly'
+    if bias_correction == 'monthly':
+        groups = days.month.values - 1
+        n_groups = 12
+    elif bias_correction in ('mean', None):
+        groups = np.zeros(len(days), dtype=int)
+        n_groups = 1
+    else:
+        raise ValueError(f'Unknown bias correction: {bias_correction}')
+
+    spatial_shape = terra.shape[1:]
+    fused = np.full((len(days),) + spatial_shape, np.nan, dtype='float32')
+    source = np.zeros(fused.shape, dtype='uint8')
+    bias = np.full((n_groups,) + spatial_shape, np.nan, dtype='float32')
+
+    block_rows = _time_contiguous_rows(terra, time_dim)
+    if block_rows is not None:
+        # whole series of a block of rows: fused, corrected and filled at once
+        row_dim = terra.dims[1]
+        for start in range(0, spatial_shape[0], block_rows):
+            rows = slice(start, start + block_rows)
+            block = _read_days(terra.isel({row_dim: rows}), terra_positions, time_dim)
+            block_source, bias_sums, bias_counts = _fuse_days(
+                block, _read_days(aqua.isel({row_dim: rows}), aqua_positions, time_dim),
+                groups, n_groups)
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                bias[:, rows] = bias_sums / bias_counts
+            if bias_correction is not None:
+                _shift_aqua(block, block_source, bias[:, rows], groups, batch)
+            if max_gap is not None:
+                fill_gaps_linear(block, block_source, max_gap)
+
+            fused[:, rows] = block
+            source[:, rows] = block_source
+    else:
+        bias_sums = np.zeros((n_groups,) + spatial_shape)
+        bias_counts = np.zeros((n_groups,) + spatial_shape, dtype='int64')
+        for start in range(0, len(days), batch):
+            stop = min(start + batch, len(days))
+            fused[start:stop] = _read_days(terra, terra_positions[start:stop], time_dim)
+            batch_source, batch_sums, batch_counts = _fuse_days(
+                fused[start:stop], _read_days(aqua, aqua_positions[start:stop], time_dim),
+                groups[start:stop], n_groups)
+            source[start:stop] = batch_source
+            bias_sums += batch_sums
+            bias_counts += batch_counts
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bias[:] = bias_sums / bias_counts
+        if bias_correction is not None:
+            _shift_aqua(fused, source, bias, groups, batch)
+        if max_gap is not None:
+            fill_gaps_linear(fused, source, max_gap)
+
+    dims = terra.dims
+    coords = {time_dim: days,
+              dims[1]: terra[dims[1]].values,
+              dims[2]: terra[dims[2]].values}
+    bias_dims = ('month',) if bias_correction == 'monthly' else ('group',)
+
+    fused_dt = xr.Dataset({'LST': (dims, fused, terra.attrs),
+                           'source': (dims, source),
+                           'overpass_bias': (bias_dims + dims[1:], bias)},
+                          coords=coords)
+    if bias_correction == 'monthly':
+        fused_dt = fused_dt.assign_coords({'month': np.arange(1, 13)})
+
+    return fused_dt.assign_attrs({'bias-correction': str(bias_correction),
+                                  'max-gap': 'none' if max_gap is None else max_gap,
+                                  'source-flags': str(SOURCE_FLAGS)})
+
+
+def retrieve_modis_fused(province, layout='spatial', bias_correction='monthly', max_gap=None):
+    """
+    Retrieves the fused terra/aqua modis dataset
+        of corresponding province (see fuse_terra_aqua).
+    layout: 'spatial' or 'time' (see retrieve_modis_merged);
+        'time' is read per block of pixels.
+    """
+
+    terra = retrieve_modis_merged(province, 'terra', layout)
+    aqua = retrieve_modis_merged(province, 'aqua', layout)
+
+    # both sensors are read in the same (time, y, x) order
+    terra = terra.transpose('time', 'y', 'x')
+    aqua = aqua.transpose('time', 'y', 'x')
+
+    fused_dt = fuse_terra_aqua(terra, aqua, 'time', bias_correction, max_gap)
+
+    fused_dt = fused_dt.rio.write_crs(terra.rio.crs)
+    return fused_dt.assign_attrs({'data-source': 'modis',
+                                  'province': province})
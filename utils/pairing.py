@@ -0,0 +1,114 @@
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import
+
+sparse = lazy_import('scipy.sparse')
+spatial = lazy_import('scipy.spatial')
+
+
+def pair_urban_rural(lu_class, radius, urban=1, rural=0, x_dims='x', y_dims='y',
+                     elevation=None, max_elevation_difference=None):
+    """
+    Pairs every urban pixel of lu_class (classify_urban_rural
+        output) with the rural pixels within radius
+        (in coordinate units of the grid).
+    Pairs can be limited to rural pixels whose elevation
+        differs at most max_elevation_difference.
+    Returns a dict of the pair indices and a sparse
+        (urban, rural) weight matrix of ones; paired_uhi
+        averages over the valid rural pixels of each pair.
+    """
+
+    lu_class = lu_class.transpose(y_dims, x_dims)
+    xx, yy = np.meshgrid(lu_class[x_dims].values, lu_class[y_dims].values)
+    points = np.column_stack([xx.ravel(), yy.ravel()])
+
+    values = lu_class.values.ravel()
+    urban_idx = np.flatnonzero(values == urban)
+    rural_idx = np.flatnonzero(values == rural)
+    if not len(rural_idx):
+        raise ValueError(f'No rural pixels (class {rural}) to pair with')
+
+    # rural neighbours of every urban pixel
+    tree = spatial.cKDTree(points[rural_idx])
+    neighbours = tree.query_ball_point(points[urban_idx], r=radius)
+
+    n_pairs = np.array([len(n) for n in neighbours], dtype='int64')
+    pair_urban = np.repeat(np.arange(len(urban_idx)), n_pairs)
+    pair_rural = np.concatenate([np.asarray(n, dtype='int64') for n in neighbours]) \
+        if len(neighbours) else np.empty(0, dtype='int64')
+
+    # drop pairs over a large elevation difference
+    if elevation is not None and max_elevation_difference is not None:
+        height = elevation.transpose(y_dims, x_dims).values.ravel()
+        keep = np.abs(height[urban_idx[pair_urban]] - height[rural_idx[pair_rural]]) \
+            <= max_elevation_difference
+        pair_urban, pair_rural = pair_urban[keep], pair_rural[keep]
+
+    weights = sparse.csr_matrix((np.ones(len(pair_urban), dtype='float32'),
+                                 (pair_urban, pair_rural)),
+                                shape=(len(urban_idx), len(rural_idx)))
+
+    return {'urban_idx': urban_idx,
+            'rural_idx': rural_idx,
+            'pair_urban': pair_urban,
+            'pair_rural': pair_rural,
+            'weights': weights,
+            'shape': lu_class.shape,
+            'y': yy.ravel()[urban_idx],
+            'x': xx.ravel()[urban_idx]}
+
+
+def paired_uhi(dt, pairs, time_dim='time', x_dims='x', y_dims='y', per_pair=False,
+               batch=256):
+    """
+    Calculates UHI of every urban pixel against the mean
+        of its paired rural pixels, and its average over
+        urban pixels, with sparse gathers per time batch.
+    per_pair: also return (time, pair) differences
+    """
+
+    dt = dt.transpose(time_dim, y_dims, x_dims)
+    n_time = dt.sizes[time_dim]
+    weights = pairs['weights']
+
+    uhi_pixel = np.full((n_time, len(pairs['urban_idx'])), np.nan, dtype='float32')
+    uhi_pair = np.full((n_time, len(pairs['pair_urban'])), np.nan, dtype='float32') \
+        if per_pair else None
+
+    for start in range(0, n_time, batch):
+        values = np.asarray(dt[start:start+batch].values, dtype='float32')
+        values = values.reshape(values.shape[0], -1)
+
+        urban_values = values[:, pairs['urban_idx']]
+        rural_values = values[:, pairs['rural_idx']]
+
+        # nan-aware mean of the paired rural pixels
+        rural_valid = ~np.isnan(rural_values)
+        rural_sum = weights @ np.where(rural_valid, rural_values, 0).T
+        rural_count = weights @ rural_valid.T.astype('float32')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rural_ref = (rural_sum / rural_count).T
+
+        uhi_pixel[start:start+batch] = urban_values - rural_ref
+
+        if per_pair:
+            uhi_pair[start:start+batch] = urban_values[:, pairs['pair_urban']] \
+                - rural_values[:, pairs['pair_rural']]
+
+    uhi = xr.Dataset({'uhi_pixel': ((time_dim, 'urban_pixel'), uhi_pixel)},
+                     coords={time_dim: dt[time_dim].values,
+                             y_dims: ('urban_pixel', pairs['y']),
+                             x_dims: ('urban_pixel', pairs['x']),
+                             'n_rural': ('urban_pixel', np.diff(weights.indptr))})
+
+    # aggregated urban-rural series
+    uhi['uhi'] = uhi['uhi_pixel'].mean(dim='urban_pixel')
+
+    if per_pair:
+        uhi['uhi_pair'] = ((time_dim, 'pair'), uhi_pair)
+        uhi = uhi.assign_coords({'pair_urban': ('pair', pairs['pair_urban']),
+                                 'pair_rural': ('pair', pairs['pair_rural'])})
+
+    return uhi
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+# qc flag bits
+QC_FLAGS = {'missing': 1,
+            'range': 2,
+            'step': 4,
+            'spike': 8,
+            'persistence': 16,
+            'consistency': 32}
+
+
+def _window_sums(values, window):
+    """
+    Sums of the trailing window of every time step
+        (axis 0); nan for the first window-1 steps.
+    """
+
+    cumsum = np.cumsum(values, axis=0, dtype='float64')
+    sums = np.full(values.shape, np.nan)
+    sums[window-1:] = cumsum[window-1:]
+    sums[window:] -= cumsum[:-window]
+
+    return sums
+
+
+def _spread_window(flag, window):
+    """
+    Marks every step within window steps before a
+        flagged window end (the whole flat window).
+    """
+
+    covered = np.cumsum(flag[::-1], axis=0)[::-1]
+    after = np.zeros_like(covered)
+    after[:-window] = covered[window:]
+
+    return (covered - after) > 0
+
+
+def _persistence(values, window, min_variance):
+    """
+    Flat-line check: variance of every complete window
+        of hourly values below min_variance.
+    """
+
+    valid = ~np.isnan(values)
+    centered = np.where(valid, values - np.nanmean(values, axis=0), 0)
+
+    n = _window_sums(valid, window)
+    s1 = _window_sums(centered, window)
+    s2 = _window_sums(centered ** 2, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = s2 / n - (s1 / n) ** 2
+    flat = (n == window) & (variance < min_variance)
+
+    return _spread_window(flat, window)
+
+
+def _consistency(values, max_z, min_stations):
+    """
+    Cross-station check: deviation of each station from
+        the station median of the same hour, standardized
+        by the station's own (MAD) spread of deviations.
+    """
+
+    n_valid = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(all='ignore'):
+        median = np.nanmedian(values, axis=1, keepdims=True)
+    deviation = values - median
+
+    # robust center and spread of every station's deviation
+    center = np.nanmedian(deviation, axis=0)
+    mad = 1.4826 * np.nanmedian(np.abs(deviation - center), axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.abs(deviation - center) / mad
+    return (z > max_z) & (n_valid >= min_stations)[:, None]
+
+
+def quality_control(dt, stations, datetime_col='Date', valid_range=(-40, 50),
+                    max_step=8, max_spike=5, persistence_window=6, min_variance=1e-3,
+                    max_z=5, min_stations=3):
+    """
+    Runs range, step, spike, persistence and cross-station
+        consistency checks on hourly station records
+        (adjust_station_data output) for all stations at once.
+    Step and spike checks only compare values 1 hour apart.
+    Returns a (time, station) uint8 flag bitmask (QC_FLAGS)
+        and a per-station summary of flagged values.
+    """
+
+    stations = list(stations)
+    dt = dt.sort_values(datetime_col)
+    values = dt[stations].to_numpy(dtype='float64')
+    flags = np.zeros(values.shape, dtype='uint8')
+
+    missing = np.isnan(values)
+    flags[missing] |= QC_FLAGS['missing']
+
+    # out of range values are not used by the other checks
+    with np.errstate(invalid='ignore'):
+        out_of_range = (values < valid_range[0]) | (values > valid_range[1])
+    flags[out_of_range] |= QC_FLAGS['range']
+    values = np.where(out_of_range, np.nan, values)
+
+    # change from the previous hour
+    hourly = (np.diff(dt[datetime_col].values) == np.timedelta64(1, 'h'))[:, None]
+    diff = np.where(hourly, np.diff(values, axis=0), np.nan)
+    previous = np.concatenate([np.full((1, len(stations)), np.nan), diff])
+    following = np.concatenate([diff, np.full((1, len(stations)), np.nan)])
+
+    with np.errstate(invalid='ignore'):
+        flags[np.abs(previous) > max_step] |= QC_FLAGS['step']
+
+        # jump away from both neighbours in the same direction
+        spike = ((previous > max_spike) & (following < -max_spike)) | \
+                ((previous < -max_spike) & (following > max_spike))
+    flags[spike] |= QC_FLAGS['spike']
+
+    flags[_persistence(values, persistence_window, min_variance)] |= QC_FLAGS['persistence']
+    flags[_consistency(values, max_z, min_stations)] |= QC_FLAGS['consistency']
+
+    flags = pd.DataFrame(flags, index=dt.index, columns=stations)
+    flags.attrs['flags'] = QC_FLAGS
+
+    return flags, summarize_flags(flags)
+
+
+def summarize_flags(flags):
+    """
+    Number of values with each flag and the flagged
+        fraction of the non-missing values of every station.
+    """
+
+    summary = pd.DataFrame({name: ((flags.values & bit) > 0).sum(axis=0)
+                            for name, bit in QC_FLAGS.items()}, index=flags.columns)
+
+    n_valid = len(flags) - summary['missing']
+    failed = ((flags.values & ~np.uint8(QC_FLAGS['missing'])) > 0).sum(axis=0)
+    summary['n_valid'] = n_valid
+    summary['flagged_fraction'] = failed / n_valid.where(n_valid > 0)
+
+    return summary
+
+
+def apply_qc(dt, flags, checks=('range', 'step', 'spike', 'persistence', 'consistency')):
+    """
+    Sets values failing any of the given checks to nan;
+        the result can be passed to calculate_yearly_mean,
+        calculate_seasonal_mean or calculate_monthly_mean.
+    """
+
+    mask = np.uint8(sum(QC_FLAGS[check] for check in checks))
+    failed = (flags.values & mask) > 0
+
+    dt = dt.copy()
+    stations = list(flags.columns)
+    dt.loc[flags.index, stations] = dt.loc[flags.index, stations].mask(failed)
+
+    return dt
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import
+
+dask = lazy_import('dask')
+dask_utils = lazy_import('dask.utils')
+netCDF4 = lazy_import('netCDF4')
+
+
+def parse_bytes(size):
+    """
+    Bytes of a size given as number or string (e.g. '256MB').
+    """
+
+    return dask_utils.parse_bytes(size) if isinstance(size, str) else size
+
+
+def time_contiguous_path(path):
+    """
+    Returns the path of the time-contiguous copy of a file
+        e.g. merged_2011_2018.nc --> merged_2011_2018_time.nc
+    """
+
+    root, ext = os.path.splitext(path)
+    return f'{root}_time{ext}'
+
+
+def find_spatial_block(n_time, n_y, n_x, itemsize, memory_limit):
+    """
+    Finds the number of rows (y) that fit into memory_limit
+        when every row is read with its full time series.
+    """
+
+    # bytes of a single row with its full time series
+    row_bytes = n_time * n_x * itemsize
+
+    return int(np.clip(memory_limit // max(row_bytes, 1), 1, n_y))
+
+
+def find_row_block(n_time, n_y, n_x, itemsize, memory_limit, chunk_xy=(32, 32)):
+    """
+    Rows (y) of the blocks rechunk_time_contiguous streams
+        through. A block is held about four times while it
+        is read, concatenated and written, so its data is
+        a quarter of memory_limit; blocks are whole on-disk
+        chunk rows, or a single smaller chunk row if not
+        even one fits.
+    Open inputs with {y_dims: block_y} chunks to keep reads
+        within memory_limit.
+    """
+
+    block_y = find_spatial_block(n_time, n_y, n_x, itemsize, parse_bytes(memory_limit) // 4)
+    chunk_y = min(chunk_xy[0], n_y)
+    if block_y < chunk_y:
+        return block_y
+
+    return block_y // chunk_y * chunk_y
+
+
+def rechunk_time_contiguous(dt, out_path, time_dim='time', x_dims='x', y_dims='y',
+                            memory_limit='256MB', chunk_xy=(32, 32)):
+    """
+    Writes a time-contiguous copy of dt to out_path.
+    Data is streamed through row blocks holding the full
+        time series, one block at a time, so that about
+        memory_limit bytes are held at once; the written
+        netcdf chunks are (full time, chunk_xy) so a pixel
+        series is read from a single chunk (chunks are
+        lower if one chunk row does not fit memory_limit).
+    dt should be lazily indexed or dask chunked no coarser
+        than the row blocks along y (see find_row_block);
+        larger input chunks are loaded as a whole.
+    """
+
+    if isinstance(dt, xr.DataArray):
+        dt = dt.to_dataset(name=dt.name or 'data')
+
+    n_time, n_y, n_x = dt.sizes[time_dim], dt.sizes[y_dims], dt.sizes[x_dims]
+
+    # the widest variable defines the block size
+    itemsize = max(dt[v].dtype.itemsize for v in dt.data_vars)
+    block_y = find_row_block(n_time, n_y, n_x, itemsize, memory_limit, chunk_xy)
+
+    # row blocks with full time series
+    dt = dt.chunk({time_dim: -1, y_dims: block_y, x_dims: -1})
+
+    # on-disk chunks: full time series of small pixel tiles
+    encoding = {}
+    for var_name in dt.data_vars:
+        var = dt[var_name]
+        chunk_sizes = {time_dim: n_time,
+                       y_dims: min(chunk_xy[0], n_y, block_y),
+                       x_dims: min(chunk_xy[1], n_x)}
+        encoding[var_name] = {'chunksizes': tuple(chunk_sizes.get(d, var.sizes[d]) for d in var.dims),
+                              'zlib': True, 'complevel': 1}
+
+        # packed (e.g. uint16 modis) sources stay packed
+        encoding[var_name].update({key: var.encoding[key]
+                                   for key in ('dtype', 'scale_factor', 'add_offset', '_FillValue')
+                                   if key in var.encoding})
+
+    # the hdf5 chunk cache of the written file (64MB by
+    #     default) is part of the memory held
+    chunk_cache = netCDF4.get_chunk_cache()
+    netCDF4.set_chunk_cache(min(chunk_cache[0], parse_bytes(memory_limit) // 4), *chunk_cache[1:])
+
+    # write to a temporary file and move it afterwards
+    tmp_path = f'{out_path}.part'
+    try:
+        # blocks one after another, parallel blocks would
+        #     multiply the memory held at once
+        with dask.config.set(scheduler='synchronous'):
+            dt.to_netcdf(tmp_path, encoding=encoding)
+        os.replace(tmp_path, out_path)
+    finally:
+        netCDF4.set_chunk_cache(*chunk_cache)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return out_path
+
+
+def open_time_contiguous(path, time_dim='time', x_dims='x', y_dims='y', chunk_xy=(32, 32),
+                         mask_and_scale=True):
+    """
+    Opens a time-contiguous copy with dask chunks
+        aligned to its on-disk chunks (chunk_xy if
+        the file has none).
+    """
+
+    dt = xr.open_dataset(path, mask_and_scale=mask_and_scale)
+
+    chunks = {time_dim: -1, y_dims: chunk_xy[0], x_dims: chunk_xy[1]}
+    for var_name in dt.data_vars:
+        chunksizes = dt[var_name].encoding.get('chunksizes')
+        if chunksizes:
+            chunks.update(zip(dt[var_name].dims, chunksizes))
+
+    return dt.chunk({dim: size for dim, size in chunks.items() if dim in dt.dims})
@@ -0,0 +1,126 @@
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+
+# heavy geo dependencies are imported on first use
+pyproj = lazy_import('pyproj')
+sparse = lazy_import('scipy.sparse')
+
+
+def _cell_index(points, centres):
+    """
+    Index of the (regular) grid cell that contains
+        each point; -1 outside the grid.
+    """
+
+    step = centres[1] - centres[0]
+    index = np.floor((points - (centres[0] - step / 2)) / step).astype('int64')
+
+    return np.where((index >= 0) & (index < len(centres)), index, -1)
+
+
+def build_overlap_weights(fine, coarse, fine_x_dim='x', fine_y_dim='y',
+                          coarse_x_dim='X', coarse_y_dim='Y', subsamples=4):
+    """
+    Builds a sparse (coarse cell, fine cell) matrix of the
+        area of each fine cell (e.g. ghs 1 km) that falls into
+        each cell of a coarse grid (e.g. chirts 0.05 deg).
+    Each fine cell is split into subsamples x subsamples
+        parts that are projected onto the coarse crs, so
+        the two grids may have different crs.
+    Weights are fractions of a fine cell (rows are not normalized).
+    Built once per grid pair and reused for every time step.
+    """
+
+    fine_x, fine_y = fine[fine_x_dim].values, fine[fine_y_dim].values
+    coarse_x, coarse_y = coarse[coarse_x_dim].values, coarse[coarse_y_dim].values
+
+    # sub-cell offsets within a fine cell
+    offsets = (np.arange(subsamples) + 0.5) / subsamples - 0.5
+    sub_x = (fine_x[:, None] + offsets[None, :] * (fine_x[1] - fine_x[0])).ravel()
+    sub_y = (fine_y[:, None] + offsets[None, :] * (fine_y[1] - fine_y[0])).ravel()
+    xx, yy = np.meshgrid(sub_x, sub_y)
+
+    # sub-cells --> coarse crs
+    load_rioxarray()
+    transformer = pyproj.Transformer.from_crs(fine.rio.crs, coarse.rio.crs, always_xy=True)
+    px, py = transformer.transform(xx.ravel(), yy.ravel())
+
+    # fine cell of every sub-cell
+    fine_iy, fine_ix = np.divmod(np.arange(xx.size), len(sub_x))
+    fine_index = (fine_iy // subsamples) * len(fine_x) + fine_ix // subsamples
+
+    # coarse cell of every sub-cell
+    coarse_ix = _cell_index(px, coarse_x)
+    coarse_iy = _cell_index(py, coarse_y)
+    inside = (coarse_ix >= 0) & (coarse_iy >= 0)
+    coarse_index = coarse_iy[inside] * len(coarse_x) + coarse_ix[inside]
+
+    # duplicates are summed when converted to csr
+    weights = sparse.coo_matrix((np.full(inside.sum(), 1 / subsamples**2, dtype='float32'),
+                                 (coarse_index, fine_index[inside])),
+                                shape=(len(coarse_y) * len(coarse_x),
+                                       len(fine_y) * len(fine_x))).tocsr()
+
+    return {'weights': weights,
+            'coarse_shape': (len(coarse_y), len(coarse_x)),
+            'coarse_coords': {coarse_y_dim: coarse_y, coarse_x_dim: coarse_x},
+            'fine_dims': (fine_y_dim, fine_x_dim)}
+
+
+def regrid_area_weighted(dt, overlap):
+    """
+    Area-weighted mean of a fine field on the coarse grid;
+        a single sparse product for all time steps.
+    """
+
+    fine_y_dim, fine_x_dim = overlap['fine_dims']
+    weights = overlap['weights']
+
+    # (fine cell, other) matrix
+    other_dims = [d for d in dt.dims if d not in overlap['fine_dims']]
+    dt = dt.transpose(fine_y_dim, fine_x_dim, *other_dims)
+    values = dt.values.reshape(weights.shape[1], -1)
+
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (weights @ np.where(valid, values, 0)) / (weights @ valid.astype('float32'))
+
+    coarse_y_dim, coarse_x_dim = overlap['coarse_coords']
+    return xr.DataArray(mean.reshape(*overlap['coarse_shape'], *[dt.sizes[d] for d in other_dims]),
+                        dims=(coarse_y_dim, coarse_x_dim, *other_dims),
+                        coords={**overlap['coarse_coords'],
+                                **{d: dt[d].values for d in other_dims if d in dt.coords}})
+
+
+def calculate_class_fractions(lu_data, overlap, classes):
+    """
+    Calculates the area fraction of each class set of
+        lu_data within every coarse cell.
+    classes: dict of name --> list of land use values e.g.
+        {'urban': [21, 22, 23, 30], 'rural': [11, 12, 13]}
+        or define_index_correspondence()
+    Fractions are relative to the valid (non-nan) area.
+    """
+
+    fractions = {}
+    for name, index in classes.items():
+
+        # class indicator keeps nan where land use is missing
+        indicator = xr.where(lu_data.isin(index), 1.0, 0.0).where(lu_data.notnull())
+        fractions[name] = regrid_area_weighted(indicator, overlap)
+
+    return xr.Dataset(fractions)
+
+
+def classify_by_fraction(fractions, urban_threshold=0.5, rural_threshold=0.5,
+                         urban='urban', rural='rural'):
+    """
+    classify coarse cells by class fractions
+    1 for urban cells, 0 for rural cells, nan for the rest
+        (same convention as classify_urban_rural)
+    """
+
+    return xr.where(fractions[urban] >= urban_threshold, 1,
+                    xr.where(fractions[rural] >= rural_threshold, 0, np.nan))
@@ -0,0 +1,173 @@
+import json
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+
+da = lazy_import('dask.array')
+
+
+def _json_default(value):
+
+    # numpy scalars and arrays in attributes
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+def _split_cube(dt):
+    """
+    Splits a DataArray into data, coordinates and
+        json-serializable metadata (dims, attrs, crs).
+    """
+
+    if not isinstance(dt, xr.DataArray):
+        raise TypeError('Only DataArrays can be shared, select a variable first')
+
+    # crs is kept as wkt and written again after attaching
+    load_rioxarray()
+    crs = dt.rio.crs
+    if 'spatial_ref' in dt.coords:
+        dt = dt.drop_vars('spatial_ref')
+
+    coords = {}
+    coord_dims = {}
+    for name, coord in dt.coords.items():
+        values = coord.values
+        if values.dtype == object:
+            values = values.astype(str)
+        coords[name] = values
+        coord_dims[name] = list(coord.dims)
+
+    meta = {'name': dt.name,
+            'dims': list(dt.dims),
+            'shape': list(dt.shape),
+            'dtype': dt.dtype.str,
+            'coord_dims': coord_dims,
+            'attrs': dt.attrs,
+            'crs': crs.to_wkt() if crs is not None else None}
+
+    return dt, coords, meta
+
+
+def _build_cube(data, coords, meta):
+    """
+    Builds a DataArray around an existing numpy buffer
+        (no copy) with its coordinates and crs.
+    """
+
+    coords = {name: (meta['coord_dims'][name], values)
+              for name, values in coords.items()}
+
+    dt = xr.DataArray(data, dims=meta['dims'], coords=coords,
+                      name=meta['name'], attrs=meta['attrs'])
+
+    if meta['crs'] is not None:
+        load_rioxarray()
+        # in place: a copy would read the whole buffer into memory
+        dt = dt.rio.write_crs(meta['crs'], inplace=True)
+
+    return dt
+
+
+def export_province_cube(dt, path):
+    """
+    Writes a clipped province cube once to an uncompressed,
+        memory-mappable directory layout:
+        data.npy (values), coords.npz, meta.json
+    Dask-backed data is written block by block.
+    """
+
+    dt, coords, meta = _split_cube(dt)
+    os.makedirs(path, exist_ok=True)
+
+    # write values straight into the memory-mapped file
+    data_path = os.path.join(path, 'data.npy')
+    out = np.lib.format.open_memmap(data_path, mode='w+',
+                                    dtype=dt.dtype, shape=dt.shape)
+    if isinstance(dt.data, da.Array):
+        da.store(dt.data, out)
+    else:
+        out[...] = dt.values
+    out.flush()
+    del out
+
+    np.savez(os.path.join(path, 'coords.npz'), **coords)
+
+    # meta is written last; its presence marks a complete export
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, default=_json_default)
+
+    return path
+
+
+def attach_province_cube(path, mode='r'):
+    """
+    Attaches a cube written by export_province_cube;
+        values are memory-mapped (zero-copy) and shared
+        through the page cache by all processes.
+    """
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+
+    data = np.load(os.path.join(path, 'data.npy'), mmap_mode=mode)
+    with np.load(os.path.join(path, 'coords.npz')) as f:
+        coords = {name: f[name] for name in f.files}
+
+    return _build_cube(data, coords, meta)
+
+
+def cached_province_cube(retrieve_func, path, *args, **kwargs):
+    """
+    Attaches the cube at path; retrieve_func(*args, **kwargs)
+        (e.g. retrieve_ghs, retrieve_corine) is run and
+        exported only if it has not been exported yet.
+    """
+
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        export_province_cube(retrieve_func(*args, **kwargs), path)
+
+    return attach_province_cube(path)
+
+
+def export_shared_cube(dt, name=None):
+    """
+    Copies a cube into multiprocessing shared memory.
+    Returns the SharedMemory block (keep it alive and
+        unlink it when done) and a picklable handle
+        to pass to attach_shared_cube in the workers.
+    """
+
+    dt, coords, meta = _split_cube(dt)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(dt.nbytes, 1), name=name)
+    data = np.ndarray(dt.shape, dtype=dt.dtype, buffer=shm.buf)
+    if isinstance(dt.data, da.Array):
+        da.store(dt.data, data)
+    else:
+        data[...] = dt.values
+
+    handle = {'shm_name': shm.name,
+              'coords': coords,
+              'meta': meta}
+
+    return shm, handle
+
+
+def attach_shared_cube(handle):
+    """
+    Attaches a cube exported by export_shared_cube
+        without copying its values.
+    Returns the DataArray and the SharedMemory block,
+        which must stay referenced while the data is used.
+    """
+
+    meta = handle['meta']
+    shm = shared_memory.SharedMemory(name=handle['shm_name'])
+    data = np.ndarray(meta['shape'], dtype=np.dtype(meta['dtype']), buffer=shm.buf)
+
+    return _build_cube(data, handle['coords'], meta), shm
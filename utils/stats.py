@@ -0,0 +1,156 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .utils import define_seasons_from_pd
+
+
+def block_bootstrap_indices(n, n_resamples, block_size, rng):
+    """
+    Moving-block bootstrap index matrix of (n_resamples, n);
+        each row is built from random blocks of block_size
+        consecutive time steps.
+    """
+
+    block_size = int(min(max(block_size, 1), n))
+    n_blocks = -(-n // block_size)
+
+    starts = rng.integers(0, n - block_size + 1, size=(n_resamples, n_blocks))
+    index = starts[:, :, None] + np.arange(block_size)
+
+    return index.reshape(n_resamples, -1)[:, :n]
+
+
+def block_sign_flips(n, n_resamples, block_size, rng):
+    """
+    Random +1/-1 signs of (n_resamples, n), constant
+        within blocks (permutation test of paired data).
+    """
+
+    block_size = int(min(max(block_size, 1), n))
+    n_blocks = -(-n // block_size)
+
+    signs = rng.choice(np.array([-1, 1], dtype='int8'), size=(n_resamples, n_blocks))
+
+    return np.repeat(signs, block_size, axis=1)[:, :n]
+
+
+def bootstrap_difference(urban, rural, n_resamples=2000, block_size=7, alpha=0.05,
+                         seed=0, max_elements=2**24):
+    """
+    Block bootstrap confidence interval and block permutation
+        (sign-flip) p-value of the mean paired difference
+        urban - rural of two aligned series.
+    Resamples are drawn as index matrices in chunks holding
+        at most max_elements values.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    diff = np.asarray(urban, dtype='float64') - np.asarray(rural, dtype='float64')
+    diff = diff[~np.isnan(diff)]
+    n = len(diff)
+    if n == 0:
+        return {'diff': np.nan, 'ci_low': np.nan, 'ci_high': np.nan,
+                'p_value': np.nan, 'n': 0}
+
+    observed = diff.mean()
+    centred = diff - observed
+    chunk = max(1, max_elements // n)
+
+    boot_means = np.empty(n_resamples)
+    perm_exceed = 0
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+
+        # bootstrap means of the resampled differences
+        index = block_bootstrap_indices(n, size, block_size, rng)
+        boot_means[start:start+size] = diff[index].mean(axis=1)
+
+        # null distribution: centred differences with random block signs
+        signs = block_sign_flips(n, size, block_size, rng)
+        perm_means = (centred * signs).mean(axis=1)
+        perm_exceed += (np.abs(perm_means) >= abs(observed)).sum()
+
+    ci_low, ci_high = np.percentile(boot_means, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+
+    return {'diff': observed,
+            'ci_low': ci_low,
+            'ci_high': ci_high,
+            'p_value': (perm_exceed + 1) / (n_resamples + 1),
+            'n': n}
+
+
+def _bootstrap_group(args):
+    urban, rural, kwargs = args
+    return bootstrap_difference(urban, rural, **kwargs)
+
+
+def _group_labels(index, mean_type):
+
+    index = pd.DatetimeIndex(index)
+    if mean_type == 'yearly':
+        return index.year
+    if mean_type == 'seasonal':
+        # same seasons as calculate_seasonal_mean
+        return define_seasons_from_pd(pd.DataFrame({'Date': index}), 'Date').values
+    if mean_type == 'monthly':
+        return index.month
+
+    raise ValueError(f'Unknown mean type: {mean_type}')
+
+
+def bootstrap_mean_difference(urban, rural, mean_types=('yearly', 'seasonal', 'monthly'),
+                              n_resamples=2000, block_size=7, alpha=0.05, seed=0,
+                              n_jobs=1, max_elements=2**24):
+    """
+    Confidence intervals and p-values of urban - rural mean
+        differences for yearly, seasonal and monthly groups
+        in one call.
+    urban, rural: pd.Series indexed by datetime, e.g. mean of
+        urban/nourban station columns or domain-mean grid series
+    n_jobs > 1 runs the groups on that many processes; each group
+        gets its own seed so results do not depend on n_jobs.
+    Returns a dict of mean type --> DataFrame.
+    """
+
+    urban, rural = urban.align(rural, join='inner')
+
+    tasks = []
+    keys = []
+    for mean_type in mean_types:
+        labels = np.asarray(_group_labels(urban.index, mean_type))
+        for label in pd.unique(labels):
+            # days outside every season
+            if pd.isnull(label):
+                continue
+            mask = labels == label
+            keys.append((mean_type, label))
+            tasks.append([urban.values[mask], rural.values[mask]])
+
+    # independent, reproducible streams per group
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [(u, r, {'n_resamples': n_resamples, 'block_size': block_size,
+                     'alpha': alpha, 'seed': s, 'max_elements': max_elements})
+             for (u, r), s in zip(tasks, seeds)]
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_bootstrap_group, tasks))
+    else:
+        results = [_bootstrap_group(task) for task in tasks]
+
+    # one DataFrame per mean type
+    output = {}
+    for mean_type in mean_types:
+        rows = {label: result for (m_type, label), result in zip(keys, results)
+                if m_type == mean_type}
+        df = pd.DataFrame(rows).transpose().astype({'n': int})
+        if mean_type == 'seasonal':
+            df = df.reindex([s for s in ['DJF', 'MAM', 'JJA', 'SON'] if s in df.index])
+        else:
+            df = df.sort_index()
+        output[mean_type] = df
+
+    return output
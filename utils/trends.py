@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ._lazy import lazy_import
+
+stats = lazy_import('scipy.stats')
+
+
+def time_to_years(time):
+    """
+    Converts a time coordinate to (decimal) years
+        so that trends are given per year.
+    """
+
+    time = np.asarray(time)
+    if not np.issubdtype(time.dtype, np.datetime64):
+        return time.astype('float64')
+
+    time = pd.DatetimeIndex(time)
+    days_in_year = np.where(time.is_leap_year, 366, 365)
+    return (time.year + (time.dayofyear - 1) / days_in_year).values.astype('float64')
+
+
+def _ols_trend(y, t):
+    """
+    Least squares slope and two-sided p-value along
+        the last axis; nan values are ignored.
+    """
+
+    valid = ~np.isnan(y)
+    n = valid.sum(axis=-1)
+    t = np.broadcast_to(t, y.shape)
+
+    # centre time and data on the valid values of each pixel
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t_mean = np.where(valid, t, 0).sum(axis=-1) / n
+        y_mean = np.nansum(y, axis=-1) / n
+        t_anom = np.where(valid, t - t_mean[..., None], 0)
+        y_anom = np.where(valid, y - y_mean[..., None], 0)
+
+        sxx = (t_anom**2).sum(axis=-1)
+        sxy = (t_anom * y_anom).sum(axis=-1)
+        slope = sxy / sxx
+
+        # standard error of the slope --> t statistic
+        resid = np.where(valid, y_anom - slope[..., None] * t_anom, 0)
+        dof = n - 2
+        se = np.sqrt((resid**2).sum(axis=-1) / dof / sxx)
+        p_value = 2 * stats.t.sf(np.abs(slope / se), dof)
+
+    slope = np.where(n > 2, slope, np.nan)
+    p_value = np.where(n > 2, p_value, np.nan)
+    return slope.astype('float32'), p_value.astype('float32')
+
+
+def _theil_sen_trend(y, t, max_elements=2**24):
+    """
+    Theil-Sen slope and Mann-Kendall two-sided p-value
+        along the last axis; nan values are ignored.
+    Pairwise differences are built for batches of pixels
+        so that at most max_elements values are held.
+    Cost grows with n_time**2: ~0.25 ms per pixel for 96
+        steps, ~4 ms for 400, ~0.3 s for 2922 (daily 2011-2018).
+    """
+
+    shape = y.shape[:-1]
+    n_time = y.shape[-1]
+    y = y.reshape(-1, n_time)
+
+    # all i < j time pairs
+    i, j = np.triu_indices(n_time, k=1)
+    dt_pair = t[j] - t[i]
+
+    slope = np.full(y.shape[0], np.nan)
+    s_stat = np.zeros(y.shape[0])
+    batch = max(1, max_elements // max(len(i), 1))
+    for start in range(0, y.shape[0], batch):
+        y_batch = y[start:start+batch]
+        dy = y_batch[:, j] - y_batch[:, i]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope[start:start+batch] = np.nanmedian(dy / dt_pair, axis=-1) \
+                if dy.shape[-1] else np.nan
+        s_stat[start:start+batch] = np.nansum(np.sign(dy), axis=-1)
+
+    # Mann-Kendall normal approximation (without tie correction)
+    n = (~np.isnan(y)).sum(axis=-1)
+    var_s = n * (n - 1) * (2 * n + 5) / 18
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (s_stat - np.sign(s_stat)) / np.sqrt(var_s)
+    p_value = 2 * stats.norm.sf(np.abs(z))
+
+    slope = np.where(n > 2, slope, np.nan).reshape(shape)
+    p_value = np.where(n > 2, p_value, np.nan).reshape(shape)
+    return slope.astype('float32'), p_value.astype('float32')
+
+
+def calculate_trend(dt, dim='time', method='ols', resample=None, alpha=0.05,
+                    max_theil_sen_steps=400):
+    """
+    Calculates per-pixel linear trend (per year) and its
+        significance for every pixel at once.
+    method: 'ols' or 'theil_sen' (Mann-Kendall p-value)
+    resample: optional frequency (e.g. '1Y', 'QS-DEC') the
+        series is averaged to before the trend is found
+    theil_sen uses all pairs of time steps, so series longer
+        than max_theil_sen_steps (e.g. daily data, hours for
+        a province) must be resampled first; yearly, seasonal
+        or monthly series take seconds to minutes.
+    Dask-backed inputs are processed chunk by chunk in parallel;
+        dim should be a single chunk (see rechunk_time_contiguous).
+    """
+
+    if resample is not None:
+        dt = dt.resample({dim: resample}).mean()
+
+    trend_funcs = {'ols': _ols_trend,
+                   'theil_sen': _theil_sen_trend}
+    if method not in trend_funcs:
+        raise ValueError(f'Unknown trend method: {method}')
+
+    if method == 'theil_sen' and dt.sizes[dim] > max_theil_sen_steps:
+        raise ValueError(f'theil_sen on {dt.sizes[dim]} time steps is too slow, '
+                         "give resample (e.g. '1Y', 'QS-DEC', '1MS') or use method='ols'")
+
+    # time axis in years
+    t = time_to_years(dt[dim].values)
+
+    if dt.chunks is not None:
+        dt = dt.chunk({dim: -1})
+
+    slope, p_value = xr.apply_ufunc(trend_funcs[method], dt,
+                                    kwargs={'t': t},
+                                    input_core_dims=[[dim]],
+                                    output_core_dims=[[], []],
+                                    dask='parallelized',
+                                    output_dtypes=['float32', 'float32'])
+
+    return xr.Dataset({'slope': slope,
+                       'p_value': p_value,
+                       'significant': p_value < alpha})\
+             .assign_attrs({'trend-method': method,
+                            'slope-unit': 'per year'})
+
+
+def calculate_uhi_anomaly(dt, lu_class, urban=1, rural=0, x_dims='x', y_dims='y'):
+    """
+    Calculates per-pixel urban minus rural-reference anomaly.
+    Rural reference is the spatial mean of rural pixels at
+        each time step; non-urban pixels are set to nan.
+    lu_class: output of classify_urban_rural on the grid of dt
+    """
+
+    # rural reference series
+    rural_ref = dt.where(lu_class == rural).mean(dim=[x_dims, y_dims])
+
+    # urban pixels minus the rural reference
+    anomaly = dt.where(lu_class == urban) - rural_ref
+
+    return anomaly.assign_attrs({'description': 'urban minus rural-reference anomaly'})
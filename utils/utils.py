@@ -1,12 +1,34 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from glob import glob
 
 import numpy as np
 import pandas as pd
-import pyproj
-import rioxarray
-from shapely.geometry import mapping
-from .data import *
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+
+# heavy geo dependencies are imported on first use
+pyproj = lazy_import('pyproj')
+rioxarray = lazy_import('rioxarray')
+shapely_geometry = lazy_import('shapely.geometry')
+
+# star-imported by the notebooks: public functions and the
+#     common modules only, never the lazy placeholders
+__all__ = ['define_modis_date', 'decode_modis', 'write_modis_packed',
+           'find_modis_tiles', 'merge_modis_tiles', 'find_modis_proj',
+           'define_dmsp_date', 'define_corine_ghs_date', 'find_wrf_proj',
+           'create_encode_and_decode', 'find_utf_problems', 'fix_utf_problems',
+           'clip_to_city', 'get_turkish_city_names', 'find_rate_of_change',
+           'find_percentage', 'define_index_correspondence', 'find_grid_amount',
+           'get_station_metadata', 'regrid_match', 'reproject_modis_landuse_data',
+           'classify_urban_rural', 'remove_nan_from_array', 'define_seasons_from_pd',
+           'calculate_yearly_mean', 'calculate_seasonal_mean', 'calculate_monthly_mean',
+           'adjust_station_data', 'prefetch', 'MODIS_SINUSOIDAL', 'MODIS_TILE_SIZE',
+           'MODIS_X_MIN', 'MODIS_Y_MAX', 'np', 'pd', 'xr', 'glob', 'datetime',
+           'timedelta']
 
 
 def define_modis_date(data, link):
@@ -24,6 +46,124 @@ def define_modis_date(data, link):
     
     return data
 
+def decode_modis(data, dtype='float32'):
+    """
+    Decodes packed (raw uint16) modis data into
+        scaled float32 values, fill values --> nan.
+    Dask-backed data is decoded lazily chunk by chunk,
+        so call it right before the reduction.
+    """
+    
+    if isinstance(data, xr.Dataset):
+        return data.map(decode_modis, dtype=dtype, keep_attrs=True)
+    
+    # already decoded
+    if not np.issubdtype(data.dtype, np.integer):
+        return data
+    
+    scale_factor = np.dtype(dtype).type(data.attrs.get('scale_factor', 
+                                                       data.encoding.get('scale_factor', 1)))
+    fill_value = data.attrs.get('_FillValue', data.encoding.get('_FillValue', 0))
+    
+    decoded = (data.astype(dtype) * scale_factor).where(data != fill_value)
+    
+    # drop packing attributes from decoded data
+    decoded.attrs = {k: v for k, v in data.attrs.items()
+                     if k not in ['scale_factor', 'add_offset', '_FillValue']}
+    return decoded
+
+def write_modis_packed(data, path):
+    """
+    Writes packed (raw uint16) modis data as
+        CF packed netcdf (uint16 + scale_factor + _FillValue).
+    The file appears under path only when complete.
+    """
+    
+    if not np.issubdtype(data.dtype, np.integer):
+        raise ValueError('Only raw counts can be written packed, retrieve with packed=True')
+    
+    data = data.copy()
+    fill_value = data.attrs.pop('_FillValue', data.encoding.get('_FillValue', 0))
+    
+    # float32 packing attributes, so that readers decode to float32
+    for key in ('scale_factor', 'add_offset'):
+        if key in data.attrs:
+            data.attrs[key] = np.float32(data.attrs[key])
+    
+    # keep nodata and packing information in the file
+    data.encoding.update({'dtype': 'uint16',
+                          '_FillValue': fill_value,
+                          'zlib': True, 'complevel': 1})
+    
+    tmp_path = f'{path}.part'
+    try:
+        data.to_netcdf(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return path
+
+# modis sinusoidal grid
+MODIS_SINUSOIDAL = '+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs'
+MODIS_TILE_SIZE = 1111950.5197665233
+MODIS_X_MIN = -20015109.354
+MODIS_Y_MAX = 10007554.677
+
+def find_modis_tiles(shapefile):
+    """
+    Finds modis sinusoidal tiles (hXXvYY) intersecting
+        the geometries of the given GeoDataFrame.
+    """
+    
+    geometry = shapefile.to_crs(MODIS_SINUSOIDAL).geometry.unary_union
+    x_min, y_min, x_max, y_max = geometry.bounds
+    
+    # candidate tiles from the bounds
+    h_range = range(int((x_min - MODIS_X_MIN) // MODIS_TILE_SIZE),
+                    int((x_max - MODIS_X_MIN) // MODIS_TILE_SIZE) + 1)
+    v_range = range(int((MODIS_Y_MAX - y_max) // MODIS_TILE_SIZE),
+                    int((MODIS_Y_MAX - y_min) // MODIS_TILE_SIZE) + 1)
+    
+    tiles = []
+    for h in h_range:
+        for v in v_range:
+            
+            # keep tiles the geometry actually intersects
+            tile = shapely_geometry.box(MODIS_X_MIN + h * MODIS_TILE_SIZE,
+                       MODIS_Y_MAX - (v + 1) * MODIS_TILE_SIZE,
+                       MODIS_X_MIN + (h + 1) * MODIS_TILE_SIZE,
+                       MODIS_Y_MAX - v * MODIS_TILE_SIZE)
+            if tile.intersects(geometry):
+                tiles.append(f'h{h:02d}v{v:02d}')
+    
+    return tiles
+
+def merge_modis_tiles(tile_dt_list, y_dims='y'):
+    """
+    Merges clipped modis data of adjacent tiles on
+        their common (outer) grid; nodata of a tile
+        is filled from the others.
+    """
+    
+    if len(tile_dt_list) == 1:
+        return tile_dt_list[0]
+    
+    # packed data keeps its fill value, decoded data uses nan
+    packed = np.issubdtype(tile_dt_list[0].dtype, np.integer)
+    fill_value = tile_dt_list[0].attrs.get('_FillValue', 0) if packed else np.nan
+    
+    aligned = xr.align(*tile_dt_list, join='outer', fill_value=fill_value)
+    
+    merged_dt = aligned[0]
+    for tile_dt in aligned[1:]:
+        nodata = merged_dt == fill_value if packed else merged_dt.isnull()
+        merged_dt = xr.where(nodata, tile_dt, merged_dt, keep_attrs=True)
+    
+    # raster order: north to south
+    return merged_dt.sortby(y_dims, ascending=False)
+
 def find_modis_proj(link):
     
     # crs of the data
@@ -121,11 +261,12 @@ def fix_utf_problems(row, encodes, decodes):
 
 
 def clip_to_city(data, shapefile, crs_data, x_dims, y_dims):
+    load_rioxarray()
     data= data.rio.set_spatial_dims(x_dim=x_dims, y_dim=y_dims)
 
     data = data.rio.write_crs(crs_data)
     
-    clipped = data.rio.clip(shapefile.geometry.apply(mapping),
+    clipped = data.rio.clip(shapefile.geometry.apply(shapely_geometry.mapping),
                             shapefile.crs, all_touched=True, 
                             invert=False, from_disk=True)
     
@@ -215,6 +356,8 @@ def regrid_match(da_to_match, da_to_be_matched,
     
     """
     
+    load_rioxarray()
+    
     # set crs for the target grid
     da_to_match = da_to_match.rio.write_crs(da_to_match_crs)
     da_to_match = da_to_match.rio.set_spatial_dims(x_dim=da_to_match_x_dim, y_dim=da_to_match_y_dim)
@@ -240,6 +383,7 @@ def reproject_modis_landuse_data(province, source_type, da_to_match_x_dim, da_to
     Get the reprojected modis data (against land use data) and 
     land use data for the given province and source type
     """
+    from .data import retrieve_ghs, retrieve_modis_merged
 
     province_lu_data = retrieve_ghs(province=province)
     province_modis_data = retrieve_modis_merged(province=province, source_type=source_type)
@@ -320,4 +464,48 @@ def adjust_station_data(dt, start_year, end_year):
     # add new datetime col
     dt['Date'] = pd.to_datetime(dt[['Year', 'Month', 'Day', 'Hour']])
     
-    return dt
\ No newline at end of file
+    return dt
+
+def prefetch(items, load_func, ahead=2, max_workers=2, memory_limit=None):
+    """
+    Yields (item, load_func(item)) in order while a bounded
+        thread pool loads the next items in the background.
+    ahead: maximum number of items loaded in advance
+    memory_limit: maximum bytes held by items loaded in
+        advance (estimated from the largest item seen so far;
+        the first item is loaded alone, as nothing is known
+        of its size before)
+    An error of load_func is raised when its item is reached;
+        pending loads are cancelled when iteration stops.
+    """
+    
+    items = list(items)
+    pending = deque()
+    next_idx = 0
+    item_bytes = None
+    
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while next_idx < len(items) or pending:
+            
+            # number of items allowed in advance under the memory cap
+            window = ahead
+            if memory_limit is not None and item_bytes is None:
+                window = 1
+            elif memory_limit is not None and item_bytes:
+                window = max(1, min(ahead, int(memory_limit // item_bytes)))
+            
+            # keep the read-ahead window full
+            while next_idx < len(items) and len(pending) < window:
+                pending.append((items[next_idx], executor.submit(load_func, items[next_idx])))
+                next_idx += 1
+            
+            item, future = pending.popleft()
+            result = future.result()
+            item_bytes = max(item_bytes or 0, getattr(result, 'nbytes', 0))
+            
+            yield item, result
+    finally:
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -1,13 +1,21 @@
-import cartopy
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as pe
-import proplot
-import seaborn as sns
-from cartopy.feature import ShapelyFeature
-from cartopy.io.shapereader import Reader
+import numpy as np
+import pandas as pd
 
-from .data import *
-from .utils import *
+from ._lazy import lazy_import
+from .utils import find_percentage
+
+# plotting dependencies are imported on first use
+cartopy = lazy_import('cartopy', submodules=('crs', 'feature', 'io.shapereader'))
+plt = lazy_import('matplotlib.pyplot')
+pe = lazy_import('matplotlib.patheffects')
+proplot = lazy_import('proplot')
+sns = lazy_import('seaborn')
+
+# star-imported by the notebooks: public functions and the
+#     common modules only, never the lazy placeholders
+__all__ = ['line_plot', 'corine_yearly_pdf_change_plot',
+           'dmsp_difference_last_first_plot', 'plot_station_mean_difference',
+           'station_time_mean_lineplot', 'modis_time_mean_lineplot', 'np', 'pd']
 
 
 def line_plot(dt, method, fig_array, suptitle):
@@ -181,12 +189,12 @@ def dmsp_difference_last_first_plot(data_df, method, fig_array, graphic_no,
 
     # add shapefiles
     turkey_district_shape = r'data/shapefiles/istanbul_ankara_izmir_shapefile.shp'
-    shape_district_turkey = ShapelyFeature(Reader(turkey_district_shape).geometries(),
+    shape_district_turkey = cartopy.feature.ShapelyFeature(cartopy.io.shapereader.Reader(turkey_district_shape).geometries(),
                                                  cartopy.crs.PlateCarree(), facecolor='none',
                                                  edgecolor = 'black', linewidth = 0.1, zorder = 0.3)
 
     turkey_province_shape = r'data/shapefiles/Iller_HGK_6360_Kanun_Sonrasi.shp'
-    shape_province_turkey = ShapelyFeature(Reader(turkey_province_shape).geometries(),
+    shape_province_turkey = cartopy.feature.ShapelyFeature(cartopy.io.shapereader.Reader(turkey_province_shape).geometries(),
                                                  cartopy.crs.PlateCarree(), facecolor='none',
                                                  edgecolor = 'black', linewidth = 0.5, zorder = 0.4)
 
@@ -0,0 +1,196 @@
+import os
+
+import numpy as np
+import xarray as xr
+
+from ._lazy import lazy_import, load_rioxarray
+from .download import atomic_to_netcdf
+from .utils import create_encode_and_decode, fix_utf_problems
+
+# heavy geo dependencies are imported on first use
+features = lazy_import('rasterio.features')
+gpd = lazy_import('geopandas')
+
+
+def _grid_attrs(dt, x_dims='x', y_dims='y'):
+    """
+    Shape and affine transform of the grid of dt,
+        as netcdf attributes.
+    """
+
+    load_rioxarray()
+    dt = dt.rio.set_spatial_dims(x_dim=x_dims, y_dim=y_dims)
+
+    return {'grid-shape': np.array([dt.sizes[y_dims], dt.sizes[x_dims]]),
+            'grid-transform': np.array(dt.rio.transform())[:6]}
+
+
+def _same_grid(labels, dt, x_dims='x', y_dims='y'):
+    """
+    True if labels were rasterized onto the grid of dt.
+    """
+
+    if 'grid-shape' not in labels.attrs or 'grid-transform' not in labels.attrs:
+        return False
+
+    grid = _grid_attrs(dt, x_dims, y_dims)
+    return (np.array_equal(labels.attrs['grid-shape'], grid['grid-shape'])
+            and np.allclose(labels.attrs['grid-transform'], grid['grid-transform']))
+
+
+def rasterize_zones(dt, shapefile, zone_col, x_dims='x', y_dims='y', all_touched=False):
+    """
+    Rasterizes all polygons of shapefile once onto the grid
+        of dt. Returns an integer label grid (0 outside,
+        i+1 for the i-th zone) with zone names; the grid
+        shape and transform are kept as attributes.
+    """
+
+    load_rioxarray()
+    dt = dt.rio.set_spatial_dims(x_dim=x_dims, y_dim=y_dims)
+    shapefile = shapefile.to_crs(dt.rio.crs).reset_index(drop=True)
+
+    shapes = ((geometry, i+1) for i, geometry in enumerate(shapefile.geometry))
+    labels = features.rasterize(shapes,
+                                out_shape=(dt.sizes[y_dims], dt.sizes[x_dims]),
+                                transform=dt.rio.transform(),
+                                fill=0, all_touched=all_touched, dtype='int32')
+
+    return xr.Dataset({'label': ((y_dims, x_dims), labels)},
+                      coords={y_dims: dt[y_dims].values,
+                              x_dims: dt[x_dims].values,
+                              'zone': shapefile[zone_col].values.astype(str)},
+                      attrs=_grid_attrs(dt, x_dims, y_dims))
+
+
+def retrieve_district_labels(dt, source_name, x_dims='x', y_dims='y', zone_col='ILCE'):
+    """
+    Retrieves the district label grid of a source grid
+        (e.g. 'modis_istanbul', 'chirts'); rasterized
+        once and cached next to the shapefile.
+    A cache rasterized onto another grid than dt
+        (another clip or province) is rebuilt.
+    """
+
+    cache_path = f'data/shapefiles/district_labels_{source_name}.nc'
+    if os.path.exists(cache_path):
+        with xr.open_dataset(cache_path) as cached:
+            if _same_grid(cached, dt, x_dims, y_dims):
+                return cached.load()
+
+    # open shapefile data
+    shapefile = gpd.read_file(r'data/shapefiles/istanbul_ankara_izmir_shapefile.shp')
+
+    # fix utf of the zone names
+    turkish_encodes, turkish_decodes = create_encode_and_decode()
+    shapefile[zone_col] = shapefile[zone_col].apply(
+        lambda x: fix_utf_problems(x, turkish_encodes, turkish_decodes)
+    ).str.lower()
+
+    labels = rasterize_zones(dt, shapefile, zone_col, x_dims, y_dims)
+    atomic_to_netcdf(labels, cache_path)
+
+    return labels
+
+
+def _sorted_groups(keys, values, n_groups):
+    """
+    Sorts values by group key, then by value.
+    Returns sorted values, group starts and group counts.
+    """
+
+    order = np.lexsort((values, keys))
+    counts = np.bincount(keys, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    return values[order], starts, counts
+
+
+def zonal_statistics(dt, labels, percentiles=(), threshold=None, time_dim='time',
+                     x_dims='x', y_dims='y', batch=64):
+    """
+    Calculates mean, count, percentiles and (if threshold
+        is given) exceedance of every zone and time step
+        in one bincount pass per batch of time steps.
+    labels: output of rasterize_zones / retrieve_district_labels
+    exceedance_days: per-pixel days >= threshold averaged over the zone
+    """
+
+    dt = dt.transpose(time_dim, y_dims, x_dims)
+
+    # labels of another grid would silently mislabel pixels
+    grid_shape = (dt.sizes[y_dims], dt.sizes[x_dims])
+    if labels['label'].shape != grid_shape:
+        raise ValueError(f'labels of shape {labels["label"].shape} do not match '
+                         f'the {grid_shape} grid of dt; rasterize them onto dt')
+    for dim in (y_dims, x_dims):
+        if dim in labels.coords and not np.allclose(labels[dim].values, dt[dim].values):
+            raise ValueError(f'{dim} coordinates of labels and dt differ; rasterize them onto dt')
+
+    label = labels['label'].values.ravel()
+    n_zones = labels.sizes['zone']
+    n_time = dt.sizes[time_dim]
+
+    # pixels inside any zone
+    inside = label > 0
+    zone_of_pixel = label[inside] - 1
+
+    sums = np.zeros((n_time, n_zones))
+    counts = np.zeros((n_time, n_zones), dtype='int64')
+    exceed = np.zeros((n_time, n_zones), dtype='int64')
+    quantiles = np.full((len(percentiles), n_time, n_zones), np.nan)
+
+    for start in range(0, n_time, batch):
+        values = np.asarray(dt[start:start+batch].values, dtype='float64')
+        n_batch = values.shape[0]
+        values = values.reshape(n_batch, -1)[:, inside]
+
+        # (time, zone) key of every valid value
+        valid = ~np.isnan(values)
+        keys = (np.arange(n_batch)[:, None] * n_zones + zone_of_pixel[None, :])[valid]
+        valid_values = values[valid]
+        n_groups = n_batch * n_zones
+
+        sums[start:start+n_batch] = np.bincount(keys, weights=valid_values,
+                                                minlength=n_groups).reshape(n_batch, n_zones)
+        counts[start:start+n_batch] = np.bincount(keys, minlength=n_groups).reshape(n_batch, n_zones)
+
+        if threshold is not None:
+            exceed[start:start+n_batch] = np.bincount(keys[valid_values >= threshold],
+                                                      minlength=n_groups).reshape(n_batch, n_zones)
+
+        if len(percentiles):
+            sorted_values, group_starts, group_counts = _sorted_groups(keys, valid_values, n_groups)
+            has_data = group_counts > 0
+
+            # linear interpolation between order statistics
+            for q_idx, q in enumerate(percentiles):
+                position = group_starts + q / 100 * (group_counts - 1)
+                lower = np.floor(position).astype('int64')
+                upper = np.minimum(lower + 1, group_starts + group_counts - 1)
+                weight = position - lower
+
+                result = np.full(n_groups, np.nan)
+                result[has_data] = (sorted_values[lower[has_data]] * (1 - weight[has_data])
+                                    + sorted_values[upper[has_data]] * weight[has_data])
+                quantiles[q_idx, start:start+n_batch] = result.reshape(n_batch, n_zones)
+
+    coords = {time_dim: dt[time_dim].values, 'zone': labels['zone'].values}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = xr.Dataset({'mean': ((time_dim, 'zone'), sums / counts),
+                            'count': ((time_dim, 'zone'), counts)},
+                           coords=coords)
+
+    for q_idx, q in enumerate(percentiles):
+        stats[f'p{q:g}'] = ((time_dim, 'zone'), quantiles[q_idx])
+
+    if threshold is not None:
+        stats['exceed_count'] = ((time_dim, 'zone'), exceed)
+
+        # mean number of days above threshold of a zone pixel
+        n_pixels = np.bincount(zone_of_pixel, minlength=n_zones)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            stats['exceedance_days'] = ('zone', exceed.sum(axis=0) / n_pixels)
+        stats = stats.assign_attrs({'threshold': threshold})
+
+    return stats